@@ -1,9 +1,25 @@
 import './App.scss';
 import { useEffect, useState } from 'react';
 import Entry from './components/Entry';
+import { appendData } from './utils/helpers';
 
 const VERSION = '0.5.0';
 
+// the channels and id prefixes to show, from e.g. `?channel=team-a&prefix=job-`; passed on to the server so it only sends those entries
+function getSubscriptionParams() {
+	const pageParams = new URLSearchParams(window.location.search);
+	const params = new URLSearchParams();
+	for (const key of ['channel', 'prefix']) {
+		pageParams.getAll(key).forEach(value => params.append(key, value));
+	}
+	return params;
+}
+
+function fetchEntries(hostname, port) {
+	const query = getSubscriptionParams().toString();
+	return fetch(`http://${hostname}:${port}/api/entries${query ? `?${query}` : ''}`).then(res => res.json());
+}
+
 function App() {
 	// Check for global configuration from widget, otherwise use URL-based detection
 	const config = window.__shellvizConfig || {};
@@ -27,14 +43,14 @@ function App() {
 	
 	function clearEntries() {
 		setEntries([]);
-		fetch(`http://${hostname}:${port}/api/clear`, { method: 'DELETE' });
+		const query = getSubscriptionParams().toString();  // only clear the entries this page shows
+		fetch(`http://${hostname}:${port}/api/clear${query ? `?${query}` : ''}`, { method: 'DELETE' });
 	}
 
 	useEffect(() => {
 		console.log(`Shellviz Client v${VERSION} initializing on http://${hostname}:${port}`);
 		
-		fetch(`http://${hostname}:${port}/api/entries`)
-			.then(res => res.json())
+		fetchEntries(hostname, port)
 			.then(data => {
 				setEntries(data);
 				setStatus('connected');
@@ -50,11 +66,29 @@ function App() {
 		let ws;
 		let retryTimeout;
 		let retryInterval = 1000;  // Initial retry interval for websocket
+		let resyncPending = false;  // whether a full reload of the entries has been scheduled
+		let lastSeq = null;  // number of the last update message received, if the server numbers them; we resume from here after a reconnect
+
+		// Reload every entry from the server; used when an `append` update can't be applied to the entry we hold
+		const resync = () => {
+			if (resyncPending) return;
+			resyncPending = true;
+			setTimeout(() => {
+				fetchEntries(hostname, port)
+					.then(data => setEntries(data))
+					.catch(err => console.error('Failed to resync entries:', err))
+					.finally(() => { resyncPending = false; });
+			}, 0);
+		};
 
 		const connectWebSocket = () => {
 			// console.log('Websocket.connecting to websocket', hostname, port)
 			setStatus('connecting');
-			ws = new WebSocket("ws://" + hostname + ":" + port);
+			// on a reconnect, ask for just the updates we missed rather than reloading every entry
+			const params = getSubscriptionParams();
+			if (lastSeq !== null) params.set('since', lastSeq);
+			const query = params.toString();
+			ws = new WebSocket("ws://" + hostname + ":" + port + "/" + (query ? `?${query}` : ''));
 
 			ws.onopen = function () {
 				// console.log("Websocket.Connected to WebSocket server");
@@ -64,19 +98,49 @@ function App() {
 
 			ws.onmessage = function (event) {
 				// console.log('Websocket.received message', event.data)
-				const entry = JSON.parse(event.data)
+				let message = JSON.parse(event.data)
+				if (message.updates) {
+					// a numbered list of updates: {seq, updates}
+					lastSeq = message.seq;
+					message = message.updates;
+				}
+				const updates = Array.isArray(message) ? message : [message]; // batched sends arrive as a list of entries to apply in order
 
 				setEntries((entries) => {
-					// Update the entry if it already exists, otherwise add it
-					const entryMap = new Map(entries.map(e => [e.id, e]));
-					entryMap.set(entry.id, entry);
+					// Update each entry if it already exists, otherwise add it
+					let entryMap = new Map(entries.map(e => [e.id, e]));
+					for (const entry of updates) {
+						if (entry.data === '___clear___') {
+							// if a special ___clear___ event is sent, empty the messages
+							entryMap = new Map();
+						} else if (entry.op === 'snapshot') {
+							// the server sent its full state instead of a backlog (we fell too far behind, or missed too much while disconnected)
+							entryMap = new Map(entry.entries.map(e => [e.id, e]));
+						} else if (entry.op === 'append') {
+							// an append only carries the new data; merge it into the entry if we hold the version it was appended to
+							// (several appends sent together are merged into one, so this can be more than one version back)
+							const existing = entryMap.get(entry.id);
+							const baseVersion = entry.base_version ?? entry.version - 1;
+							if (existing && existing.version >= entry.version) {
+								continue; // already included, e.g. by a reload that raced with this update
+							} else if (existing && existing.version === baseVersion) {
+								let data = appendData(existing.data, entry.data);
+								if (entry.max_length && data.length > entry.max_length) {
+									data = data.slice(-entry.max_length); // the server only keeps the most recent items; do the same
+								}
+								entryMap.set(entry.id, { ...existing, view: entry.view, data, version: entry.version });
+							} else {
+								resync(); // we missed an update to this entry
+							}
+						} else if (entry.op === 'delete') {
+							// the server evicted this entry to stay within its memory budget
+							entryMap.delete(entry.id);
+						} else {
+							entryMap.set(entry.id, entry);
+						}
+					}
 					return Array.from(entryMap.values());
 				});
-
-				if (entry.data === '___clear___') {
-					// if a special ___clear___ event is sent, empty the messages
-					setEntries([]);
-				}
 			};
 
 			ws.onclose = function () {
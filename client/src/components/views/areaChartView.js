@@ -33,12 +33,14 @@ export const AreaChartView = {
   evaluator: (value) => isValidAreaChartData(value),
   Component: ({ data }) => {
     const areaChartData = getAreaChartData(data);
+    // a downsampled series arrives as [index, value] pairs with gaps between the indexes, so place them on a linear scale
+    const downsampled = data.length > 0 && Array.isArray(data[0]);
     return (
       <div className="h-96 bg-gray-200 p-4 rounded-md">
         <ResponsiveLine
           data={areaChartData}
           margin={{ top: 50, right: 10, bottom: 50, left: 50 }}
-          xScale={{ type: "point" }}
+          xScale={downsampled ? { type: "linear", min: "auto", max: "auto" } : { type: "point" }}
           yScale={{
             type: "linear",
             stacked: true,
@@ -63,7 +65,7 @@ export const AreaChartView = {
             legendOffset: -40,
             legendPosition: "middle",
           }}
-          pointSize={10}
+          pointSize={downsampled ? 0 : 10}
           pointColor={{ theme: "background" }}
           pointBorderWidth={2}
           pointBorderColor={{ from: "serieColor" }}
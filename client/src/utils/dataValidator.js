@@ -267,7 +267,11 @@ export const isValidBarChartData = (data) => {
  ************************************************************
  */
 
+// a list of numbers, or of [position, number] pairs, which is how the server sends a long series it has downsampled
+export const isPositionedPoint = (val) =>
+  _.isArray(val) && val.length === 2 && _.isNumber(val[0]) && _.isNumber(val[1]);
+
 export const isValidAreaChartData = (data) => {
   const jsonData = parseJSON(data);
-  return _.isArray(jsonData) && isValid(jsonData, (val) => _.isNumber(val));
+  return _.isArray(jsonData) && isValid(jsonData, (val) => _.isNumber(val) || isPositionedPoint(val));
 };
@@ -155,8 +155,28 @@ export const getAreaChartData = (data) => {
   const areaChartFormattedData = [
     {
       id: "data", // id is the name of the series which in our case it doesn't matter
-      data: _.map(data, (value, key) => ({ x: key, y: value })), // data is an array of objects with x (as the index of the array) and y properties
+      // data is an array of objects with x (as the index of the array) and y properties
+      // a series the server has downsampled arrives as [index, value] pairs instead, since only some of the indexes are left
+      data: _.map(data, (value, key) => (_.isArray(value) ? { x: value[0], y: value[1] } : { x: key, y: value })),
     },
   ];
   return areaChartFormattedData;
 };
+
+/**
+ * Appends new data to an entry's existing data, matching how the server merges `append` updates:
+ * arrays are concatenated, strings are joined and objects are merged.
+ * @param {Array|string|Object} existingData - The data the entry currently holds.
+ * @param {Array|string|Object} data - The newly appended chunk, of the same type as `existingData`.
+ * @returns {Array|string|Object} The merged data.
+ * @example
+ * appendData([1, 2], [3]); // returns [1, 2, 3]
+ */
+export const appendData = (existingData, data) => {
+  if (_.isArray(existingData)) {
+    return existingData.concat(data);
+  } else if (_.isString(existingData)) {
+    return existingData + data;
+  }
+  return { ...existingData, ...data };
+};
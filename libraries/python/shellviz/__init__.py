@@ -1,4 +1,5 @@
 from .client import Shellviz
+from .async_client import AsyncShellviz
 from typing import Optional
 
 # Global instance of Shellviz
@@ -0,0 +1,230 @@
+from typing import Optional
+import asyncio
+import collections
+import time
+import json as jsonFn
+from urllib.parse import quote
+from .utils_serialize import to_json_safe
+from .utils import get_stack_trace
+from .utils_html import HttpResponse, HTTP_IDEMPOTENT_METHODS, HTTP_KEEP_ALIVE_MAX_REQUESTS, encode_request, parse_base_url, parse_response_headers, get_unix_socket_path
+from .server import ShellvizServer, Subscription
+from .client import Shellviz
+from .config import SHELLVIZ_PORT, SHELLVIZ_SHOW_URL, SHELLVIZ_URL, SHELLVIZ_AUTO_START, SHELLVIZ_CHANNEL
+
+
+class AsyncShellviz:
+    """
+    An asyncio-native Shellviz client; every method is a coroutine that never blocks the event loop
+
+    All requests share one persistent keep-alive connection and are pipelined: a request is written as soon as it is made,
+    without waiting for the responses to earlier ones, so many sends can be in flight at once (e.g. via `asyncio.gather`)
+
+    e.g.
+        sv = AsyncShellviz()
+        await sv.log('hello')
+        await asyncio.gather(*(sv.progress(i / 100, id='migration') for i in range(100)))
+        await sv.wait()
+    """
+    def __init__(self, show_url: Optional[bool] = None, port: Optional[int] = None, url: Optional[str] = None, auto_start: Optional[bool] = None, max_in_flight: int = 256, channel: Optional[str] = None):
+        """
+        Args:
+            show_url: Whether to show the URL on startup; defaults to SHELLVIZ_SHOW_URL
+            port: The port to use for the server; defaults to SHELLVIZ_PORT
+            url: The base URL to use for the server, or `unix://<socket path>`; defaults to SHELLVIZ_URL
+            auto_start: Whether to start the server automatically if it is not already running; defaults to SHELLVIZ_AUTO_START
+            max_in_flight: The maximum number of requests awaiting a response at once; further requests wait for a slot
+            channel: The channel entries are sent to unless `send` is given another; `clear` only clears this channel. Defaults to SHELLVIZ_CHANNEL
+        """
+        self.port = port if port is not None else SHELLVIZ_PORT
+        self.base_url = url if url is not None else SHELLVIZ_URL
+        self.show_url_on_start = show_url if show_url is not None else SHELLVIZ_SHOW_URL
+        self.auto_start = auto_start if auto_start is not None else SHELLVIZ_AUTO_START
+        self.max_in_flight = max_in_flight
+        self.channel = channel if channel is not None else SHELLVIZ_CHANNEL
+        self.server = None  # the ShellvizServer instance, if this client started it; entries are then handed to it directly
+
+        self._reader = None
+        self._writer = None
+        self._pending = collections.deque()  # futures for requests on the current connection that are awaiting a response, in request order
+        self._response_task = None  # reads responses off the current connection and resolves `_pending`
+        self._connect_lock = None  # created lazily so that it binds to the loop the client is used from
+        self._in_flight = None
+        self._expires_at = None  # monotonic time after which the server may have closed the current connection for being idle
+        self._requests_sent = 0  # requests written to the current connection
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # -- Connection methods --
+    async def _open_connection(self):
+        scheme, host, port, _ = parse_base_url(self.base_url)
+        if scheme == 'unix':
+            return await asyncio.open_unix_connection(host)
+        return await asyncio.open_connection(host, port, ssl=True if scheme == 'https' else None)
+
+    async def _ensure_connection(self):
+        """
+        Opens the connection if it isn't open, starting a server if none is running and `auto_start` is set
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        async with self._connect_lock:
+            if self._writer and not self._pending and self._expires_at is not None and time.monotonic() >= self._expires_at:
+                self._writer.close()  # idle past the server's keep-alive timeout; open a new connection rather than find out the hard way
+            # the server closes a connection after HTTP_KEEP_ALIVE_MAX_REQUESTS requests, and requests pipelined past that can take
+            # its last responses down with them when it does; move on to a new connection first, leaving the old one to finish
+            if self.server or (self._writer and not self._writer.is_closing() and self._requests_sent < HTTP_KEEP_ALIVE_MAX_REQUESTS):
+                return
+            try:
+                self._reader, self._writer = await self._open_connection()
+            except (ConnectionRefusedError, FileNotFoundError):
+                if not self.auto_start:
+                    raise
+                await self.start_server()
+                if self.server:
+                    return  # entries are handed to the in-process server directly; no connection needed
+                self._reader, self._writer = await self._open_connection()
+
+            self._pending = collections.deque()
+            self._requests_sent = 0
+            self._response_task = asyncio.get_running_loop().create_task(self._read_responses(self._reader, self._writer, self._pending))
+
+    async def _read_responses(self, reader, writer, pending):
+        closed_by_server = False  # whether the server said it was closing the connection, and so never read the requests still pending
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                status_code, headers = parse_response_headers(head[:-4])
+                content_length = int(headers.get('content-length', '0'))
+                body = await reader.readexactly(content_length) if content_length > 0 else b''
+                future = pending.popleft()
+                response = HttpResponse(status_code=status_code, headers=headers, body=body, raw=head + body)
+                if response.keep_alive_timeout:
+                    self._expires_at = time.monotonic() + response.keep_alive_timeout - 1  # leave a margin for the trip to the server
+                if not future.done():
+                    future.set_result(response)
+                if headers.get('connection', '').lower() == 'close':
+                    closed_by_server = True
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # the server closed the connection (e.g. its keep-alive timeout expired) or the client is closing
+        finally:
+            # fail anything still waiting on this connection; the next request opens a new one
+            writer.close()
+            while pending:
+                future = pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionAbortedError('Request not read by Shellviz server') if closed_by_server else ConnectionResetError('Connection to Shellviz server closed'))
+
+    async def _request(self, path: str, body=None, method: str = 'GET', retry: bool = True) -> HttpResponse:
+        _, _, _, host_header = parse_base_url(self.base_url)
+        request = encode_request(method, path, host_header, body)
+
+        try:
+            async with self._in_flight:
+                await self._ensure_connection()  # the connection may have closed while waiting for a slot
+                future = asyncio.get_running_loop().create_future()
+                self._pending.append(future)
+                self._requests_sent += 1
+                try:
+                    self._writer.write(request)
+                    await self._writer.drain()
+                except ConnectionError:
+                    pass  # whether the server read the request is only known from the responses; `future` fails with ConnectionAbortedError if it didn't
+                return await future
+        except ConnectionAbortedError:
+            # the server closed the connection (e.g. after its maximum number of requests) before reading this one; it is safe to resend
+            return await self._request(path, body, method, retry=retry)
+        except ConnectionError:
+            if not retry or method not in HTTP_IDEMPOTENT_METHODS:
+                raise  # e.g. a POST, which the server may have read and applied before the connection closed
+            # the connection was closed underneath us (usually an idle timeout on the server); retry once on a fresh one
+            return await self._request(path, body, method, retry=False)
+
+    async def close(self):
+        if self._response_task:
+            self._response_task.cancel()
+        if self._writer and not self._writer.is_closing():
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+    # -- / Connection methods --
+
+    async def start_server(self):
+        sv = ShellvizServer(port=self.port, socket_path=get_unix_socket_path(self.base_url))
+        await asyncio.to_thread(sv.initialized_event.wait, 10)  # wait up to 10 seconds for initialization, without blocking the loop
+        if not sv.is_initialized:
+            raise Exception('Server failed to initialize within 10 seconds')
+        self.server = sv
+
+        if self.show_url_on_start:
+            self.show_url()
+            self.show_qr_code(warn_on_import_error=False)
+
+    async def send(self, value, id: str = None, view: Optional[str] = None, append: bool = False, wait: bool = False, channel: Optional[str] = None):
+        channel = channel if channel is not None else self.channel
+        await self._ensure_connection()
+        if self.server:
+            # the server runs in this process; hand the entry straight to its loop (see `Shellviz.send`)
+            value = to_json_safe(value)
+            if value:
+                self.server.send_threadsafe(value, id=id, view=view, append=append, channel=channel)
+        else:
+            await self._request('/api/send', {
+                'id': id,
+                'data': value,
+                'view': view,
+                'append': append,
+                'channel': channel,
+            }, method='POST')
+
+        if wait:
+            await self.wait()
+
+    async def clear(self):
+        await self._ensure_connection()
+        if self.server:
+            self.server.clear_threadsafe(Subscription.create([self.channel]))  # applied in order with the entries sent before and after it
+        else:
+            await self._request(f'/api/clear?channel={quote(self.channel)}' if self.channel else '/api/clear', method='DELETE')
+
+    async def wait(self):
+        await self._ensure_connection()
+        if self.server:
+            await asyncio.to_thread(self.server.wait)
+        else:
+            await self._request('/api/wait')  # pipelined behind every earlier request, so the server only sees it once they are applied
+
+    # these only print; they are shared with the blocking client
+    show_url = Shellviz.show_url
+    show_qr_code = Shellviz.show_qr_code
+
+    # -- Convenience methods for quickly sending data with a specific view --
+    async def json(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='json', append=append)
+    async def markdown(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='markdown', append=append)
+    async def progress(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='progress', append=append)
+    async def pie(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='pie', append=append)
+    async def number(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='number', append=append)
+    async def area(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='area', append=append)
+    async def bar(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='bar', append=append)
+    async def card(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='card', append=append)
+    async def location(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='location', append=append)
+    async def raw(self, data, id: Optional[str] = None, append: bool = False): await self.send(data, id=id, view='raw', append=append)
+    async def stack(self, id: Optional[str] = None): await self.send(get_stack_trace(), id=id, view='stack')
+    async def log(self, *data, id: Optional[str] = None):
+        data = jsonFn.dumps(to_json_safe(data))
+        id = id or ('log-' + self.channel if self.channel else 'log')  # see `Shellviz.log`
+        value = [(data, time.time())]
+        await self.send(value, id=id, view='log', append=True)
+    async def table(self, data, id: Optional[str] = None, append: bool = False):
+        formatted_data = data
+        if isinstance(data, list) and len(data) > 0 and not isinstance(data[0], list):
+            formatted_data = [data]  # see `Shellviz.table`
+        await self.send(formatted_data, id=id, view='table', append=append)
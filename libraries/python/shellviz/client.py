@@ -1,30 +1,50 @@
 from typing import Optional
+import atexit
+import os
+import socket
+import tempfile
 import time
+from urllib.parse import quote
 import json as jsonFn
 from .utils_serialize import to_json_safe
 from .utils import get_stack_trace
-from .utils_html import send_request, print_qr, get_local_ip
-from .server import ShellvizServer
-from .config import SHELLVIZ_PORT, SHELLVIZ_SHOW_URL, SHELLVIZ_URL, SHELLVIZ_AUTO_START
+from .utils_html import send_request, NoResponseError, print_qr, get_local_ip, get_unix_socket_path
+from .utils_queue import BackgroundSendQueue
+from .utils_websockets import WebSocketClient
+from .utils_process import start_server_process, stop_server_process
+from .server import ShellvizServer, Subscription
+from .config import SHELLVIZ_PORT, SHELLVIZ_SHOW_URL, SHELLVIZ_URL, SHELLVIZ_AUTO_START, SHELLVIZ_BACKGROUND, SHELLVIZ_QUEUE_SIZE, SHELLVIZ_QUEUE_OVERFLOW, SHELLVIZ_TRANSPORT, SHELLVIZ_SERVER_PROCESS, SHELLVIZ_CHANNEL
 
 class Shellviz:
-    def __init__(self, show_url: Optional[bool] = None, port: Optional[int] = None, url: Optional[str] = None, auto_start: Optional[bool] = None):
+    def __init__(self, show_url: Optional[bool] = None, port: Optional[int] = None, url: Optional[str] = None, auto_start: Optional[bool] = None, background: Optional[bool] = None, queue_size: Optional[int] = None, queue_overflow: Optional[str] = None, transport: Optional[str] = None, server_process: Optional[bool] = None, channel: Optional[str] = None):
         """
         Args:
             show_url: Whether to show the URL on startup; defaults to SHELLVIZ_SHOW_URL
             port: The port to use for the server; defaults to SHELLVIZ_PORT
-            url: The base URL to use for the server; defaults to SHELLVIZ_URL
+            url: The base URL to use for the server, or `unix://<socket path>` to talk to a server on this host over a unix domain socket; defaults to SHELLVIZ_URL
             auto_start: Whether to start the server automatically if it is not already running; defaults to SHELLVIZ_AUTO_START
+            background: Whether `send` should enqueue entries and return immediately, leaving a background thread to deliver them in batches; defaults to SHELLVIZ_BACKGROUND
+            queue_size: The maximum number of entries held in the background queue; defaults to SHELLVIZ_QUEUE_SIZE
+            queue_overflow: What to do when the background queue is full: 'block', 'drop_oldest' or 'drop_newest'; defaults to SHELLVIZ_QUEUE_OVERFLOW
+            transport: 'http' to send each update as its own request, or 'websocket' to stream them over one long-lived connection; defaults to SHELLVIZ_TRANSPORT
+            server_process: Whether a server started by this client runs in a separate process rather than a thread of this one; entries are then streamed to it over a unix domain socket. Defaults to SHELLVIZ_SERVER_PROCESS
+            channel: The channel entries are sent to unless `send` is given another, so that browsers can subscribe to just this client's entries; `clear` only clears this channel. Defaults to SHELLVIZ_CHANNEL
         """
         self.port = port if port is not None else SHELLVIZ_PORT
         self.base_url = url if url is not None else SHELLVIZ_URL
         self.show_url_on_start = show_url if show_url is not None else SHELLVIZ_SHOW_URL
         self.auto_start = auto_start if auto_start is not None else SHELLVIZ_AUTO_START
+        self.background = background if background is not None else SHELLVIZ_BACKGROUND
+        self.server_process = server_process if server_process is not None else SHELLVIZ_SERVER_PROCESS
+        self.channel = channel if channel is not None else SHELLVIZ_CHANNEL
+        self.server = None  # the ShellvizServer instance, if this client started it; entries are then handed to it directly instead of over HTTP
+        self.websocket = None  # the producer websocket used to send entries when `transport` is 'websocket'
+        self.process = None  # the server's process, if this client started one with `server_process`
         
         # Try to connect to existing server
         try:
             send_request('/api/running', base_url=self.base_url)
-        except ConnectionRefusedError:
+        except (ConnectionRefusedError, FileNotFoundError):  # FileNotFoundError: a `unix://` url whose socket does not exist yet
             # Only start a server if we're using localhost (not a custom url)
             if self.auto_start:
                 self.start_server()
@@ -32,37 +52,135 @@ class Shellviz:
                 # If using a custom url and can't connect, print a warning
                 print(f'Shellviz cannot connect to server at {self.base_url}')
 
+        if ((transport or SHELLVIZ_TRANSPORT) == 'websocket' or self.process) and not self.server:
+            self.websocket = WebSocketClient(self.base_url)
+
+        # Created after the server so that, at exit, queued entries are flushed before the server shuts down
+        self.send_queue = None
+        if self.background and not self.server:  # an owned server already makes `send` a non-blocking handoff
+            self.send_queue = BackgroundSendQueue(
+                self._send_batch,
+                maxsize=queue_size if queue_size is not None else SHELLVIZ_QUEUE_SIZE,
+                overflow=queue_overflow if queue_overflow is not None else SHELLVIZ_QUEUE_OVERFLOW,
+            )
+
     def start_server(self):
-        sv = ShellvizServer(port=self.port)
+        if self.server_process:
+            self._start_server_process()
+            return
+
+        sv = ShellvizServer(port=self.port, socket_path=get_unix_socket_path(self.base_url))
         sv.initialized_event.wait(timeout=10)  # wait up to 10 seconds for initialization
         if not sv.is_initialized:
             raise Exception('Server failed to initialize within 10 seconds')
+        self.server = sv
 
         if self.show_url_on_start:
             self.show_url()
             self.show_qr_code(warn_on_import_error=False)
 
-    def send(self, value, id: str = None, view: Optional[str] = None, append: bool = False, wait: bool = False):
-        send_request('/api/send', {
+    def _start_server_process(self):
+        socket_path = get_unix_socket_path(self.base_url)
+        if not socket_path and hasattr(socket, 'AF_UNIX'):
+            # talk to the server over a unix domain socket rather than tcp; browsers still use the port
+            socket_path = os.path.join(tempfile.gettempdir(), f'shellviz-{self.port}.sock')
+            self.base_url = f'unix://{socket_path}'
+        self.process = start_server_process(self.port, self.base_url, socket_path=socket_path)
+        atexit.register(self.shutdown)  # registered before the send queue's, so it runs after the queue has been flushed
+
+        if self.show_url_on_start:
+            self.show_url()
+            self.show_qr_code(warn_on_import_error=False)
+
+    def shutdown(self):
+        """
+        Delivers anything still queued and, if this client started the server, shuts it down
+        """
+        if self.send_queue:
+            self.send_queue.close()
+        if self.websocket:
+            self.websocket.close()  # returns once the server has handled everything sent over it
+        if self.server:
+            self.server.shutdown()
+        if self.process:
+            stop_server_process(self.process)
+
+    def send(self, value, id: str = None, view: Optional[str] = None, append: bool = False, wait: bool = False, channel: Optional[str] = None):
+        channel = channel if channel is not None else self.channel
+        if self.server:
+            # the server runs in this process; skip the JSON encode, HTTP round trip and decode and hand the entry straight to its loop
+            # `to_json_safe` takes a copy so that later changes to `value` (or appends to it on the server) don't leak between the two
+            value = to_json_safe(value)
+            if value:  # mirror `/api/send`, which ignores entries without data
+                self.server.send_threadsafe(value, id=id, view=view, append=append, channel=channel)
+            return
+
+        entry = {
             'id': id,
             'data': value,
             'view': view,
-            'append': append
-        }, method='POST', base_url=self.base_url)
+            'append': append,
+            'channel': channel,
+        }
+        if self.send_queue:
+            # the entry is only serialized later on the flusher thread; copy `value` now so later changes to it don't leak in
+            entry['data'] = to_json_safe(value)
+            self.send_queue.put(entry)
+        elif self.websocket:
+            self.websocket.send(jsonFn.dumps(entry))
+        else:
+            try:
+                send_request('/api/send', entry, method='POST', base_url=self.base_url)
+            except NoResponseError:
+                pass  # the server read the entry but closed the connection without answering; `send` doesn't wait on a reply, so don't fail over it
+
+    def _send_batch(self, entries: list):
+        # used by the background queue to deliver everything it has accumulated in a single request
+        encoded_entries = []
+        for entry in entries:
+            try:
+                encoded_entries.append(jsonFn.dumps(entry))
+            except (TypeError, ValueError, RuntimeError) as e:  # RuntimeError: e.g. too deeply nested to encode
+                print(f'Shellviz: could not serialize entry {entry.get("id")}: {e}')
+        if encoded_entries and self.websocket:
+            self.websocket.send('[' + ','.join(encoded_entries) + ']')
+        elif encoded_entries:
+            send_request('/api/send_batch', '\n'.join(encoded_entries), method='POST', base_url=self.base_url)
 
     def clear(self):
-        send_request('/api/clear', method='DELETE', base_url=self.base_url)
+        if self.server:
+            # applied in order with the entries handed to the loop before and after it
+            self.server.clear_threadsafe(Subscription.create([self.channel]))
+            return
+        if self.send_queue:
+            self.send_queue.flush()  # make sure entries queued before the clear don't arrive after it
+        if self.websocket:
+            self.websocket.send(jsonFn.dumps({'op': 'clear', 'channel': self.channel}))
+        else:
+            send_request(f'/api/clear?channel={quote(self.channel)}' if self.channel else '/api/clear', method='DELETE', base_url=self.base_url)
     
     def wait(self):
-        send_request('/api/wait', method='GET', timeout=60*10, base_url=self.base_url)
+        if self.server:
+            self.server.wait()
+            return
+        if self.send_queue:
+            self.send_queue.flush()  # deliver everything queued so far before asking the server to flush to its clients
+        if self.websocket:
+            self.websocket.wait(timeout=60*10)
+        else:
+            send_request('/api/wait', method='GET', timeout=60*10, base_url=self.base_url)
         
     def show_url(self):
-        print(f'Shellviz running on {self.base_url}')
+        if get_unix_socket_path(self.base_url):
+            # browsers can't open a unix socket; point them at the tcp listener instead
+            print(f'Shellviz running on http://localhost:{self.port}')
+        else:
+            print(f'Shellviz running on {self.base_url}')
 
     def show_qr_code(self, warn_on_import_error=True):
         try:
             # if qrcode module is installed, output a QR code with the server's URL; fail silently if the package is not included
-            if self.base_url.startswith('http://localhost:') or self.base_url.startswith('http://127.0.0.1:'):
+            if self.base_url.startswith('http://localhost:') or self.base_url.startswith('http://127.0.0.1:') or get_unix_socket_path(self.base_url):
                 # For localhost, use the local IP for better mobile access
                 print_qr(f'http://{get_local_ip()}:{self.port}')
             else:
@@ -86,7 +204,9 @@ class Shellviz:
     def stack(self, id: Optional[str] = None): self.send(get_stack_trace(), id=id, view='stack')
     def log(self, *data, id: Optional[str] = None): 
         data = jsonFn.dumps(to_json_safe(data)) 
-        id = id or 'log' #  if an id is provided use it, but if not use 'log' so we can append all logs to the same entry
+        # if an id is provided use it, but if not use 'log' so we can append all logs to the same entry
+        # ids are shared by every channel, so a client with a channel keeps its default log separate from other channels'
+        id = id or (f'log-{self.channel}' if self.channel else 'log')
         value = [(data, time.time())] # create the log entry; a tuple of (data, timestamp) in a list that can be appended to an existing log entry
         self.send(value, id=id, view='log', append=True)
     def table(self, data, id: Optional[str] = None, append: bool = False): 
@@ -60,4 +60,19 @@ def _get_config_value(key: str, default: Any = None, converter=None):
 SHELLVIZ_PORT = _get_config_value('SHELLVIZ_PORT', 5544, _str_to_int)
 SHELLVIZ_SHOW_URL = _get_config_value('SHELLVIZ_SHOW_URL', True, _str_to_bool)
 SHELLVIZ_URL = _get_config_value('SHELLVIZ_URL', f'http://localhost:{SHELLVIZ_PORT}') 
-SHELLVIZ_AUTO_START = _get_config_value('SHELLVIZ_AUTO_START', _get_config_value('DEBUG', True, _str_to_bool), _str_to_bool)
\ No newline at end of file
+SHELLVIZ_AUTO_START = _get_config_value('SHELLVIZ_AUTO_START', _get_config_value('DEBUG', True, _str_to_bool), _str_to_bool)
+SHELLVIZ_BACKGROUND = _get_config_value('SHELLVIZ_BACKGROUND', False, _str_to_bool)
+SHELLVIZ_QUEUE_SIZE = _get_config_value('SHELLVIZ_QUEUE_SIZE', 10000, _str_to_int)
+SHELLVIZ_QUEUE_OVERFLOW = _get_config_value('SHELLVIZ_QUEUE_OVERFLOW', 'block')
+SHELLVIZ_TRANSPORT = _get_config_value('SHELLVIZ_TRANSPORT', 'http')
+SHELLVIZ_SERVER_PROCESS = _get_config_value('SHELLVIZ_SERVER_PROCESS', False, _str_to_bool)
+SHELLVIZ_CHANNEL = _get_config_value('SHELLVIZ_CHANNEL', None)
+SHELLVIZ_MAX_ENTRY_LENGTH = _get_config_value('SHELLVIZ_MAX_ENTRY_LENGTH', None, _str_to_int)
+SHELLVIZ_MEMORY_BUDGET = _get_config_value('SHELLVIZ_MEMORY_BUDGET', None, _str_to_int)
+SHELLVIZ_COMPRESSION = _get_config_value('SHELLVIZ_COMPRESSION', True, _str_to_bool)
+SHELLVIZ_COMPRESSION_THRESHOLD = _get_config_value('SHELLVIZ_COMPRESSION_THRESHOLD', 1024, _str_to_int)
+SHELLVIZ_COMPRESSION_CONTEXT_TAKEOVER = _get_config_value('SHELLVIZ_COMPRESSION_CONTEXT_TAKEOVER', False, _str_to_bool)
+SHELLVIZ_UPDATE_RATE = _get_config_value('SHELLVIZ_UPDATE_RATE', 30, _str_to_int)
+SHELLVIZ_JOURNAL = _get_config_value('SHELLVIZ_JOURNAL', None)
+SHELLVIZ_SPILL_THRESHOLD = _get_config_value('SHELLVIZ_SPILL_THRESHOLD', None, _str_to_int)
+SHELLVIZ_DOWNSAMPLE_POINTS = _get_config_value('SHELLVIZ_DOWNSAMPLE_POINTS', 2000, _str_to_int)
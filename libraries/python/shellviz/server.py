@@ -1,30 +1,224 @@
 import asyncio
 import atexit
+import collections
+import copy
 import threading
 import time
 import json as jsonFn
-from .utils_serialize import to_json_string
+from dataclasses import dataclass
 from typing import Optional
-from .utils import append_data
-from .utils_html import parse_request, write_200, write_404, write_cors_headers, write_file, write_json, BufferedStreamReader
-from .utils_websockets import send_websocket_message, receive_websocket_message, perform_websocket_handshake
-from .config import SHELLVIZ_PORT
+from .utils import append_data, is_replayable_append, get_json_size
+from .utils_html import HttpRequestReader, write_200, write_400, write_404, write_cors_headers, write_file, write_json, write_asset, StaticAssets, get_unix_socket_path, HTTP_KEEP_ALIVE_TIMEOUT, HTTP_KEEP_ALIVE_MAX_REQUESTS, HTTP_LINGER_TIMEOUT
+from .utils_journal import Journal, read_journal
+from .utils_blobs import Blob, BlobStore, estimate_json_size, to_json_parts
+from .utils_series import Series
+from .utils_websockets import send_websocket_message, receive_websocket_message, perform_websocket_handshake, encode_websocket_frame, encode_websocket_frame_header, PerMessageDeflate
+from .config import SHELLVIZ_PORT, SHELLVIZ_URL, SHELLVIZ_MAX_ENTRY_LENGTH, SHELLVIZ_MEMORY_BUDGET, SHELLVIZ_COMPRESSION, SHELLVIZ_COMPRESSION_THRESHOLD, SHELLVIZ_COMPRESSION_CONTEXT_TAKEOVER, SHELLVIZ_UPDATE_RATE, SHELLVIZ_JOURNAL, SHELLVIZ_SPILL_THRESHOLD, SHELLVIZ_DOWNSAMPLE_POINTS
 import os
+import stat
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+WEBSOCKET_QUEUE_SIZE = 1000  # messages a websocket client may fall behind by before its backlog is replaced with a snapshot
+WEBSOCKET_DRAIN_TIMEOUT = 10  # seconds a websocket client has to accept a message before it is disconnected
+WEBSOCKET_PING_INTERVAL = 20  # seconds a websocket client may go without a message before it is pinged; one silent for twice this is disconnected
+SYNC_HISTORY_SIZE = 1000  # recent broadcasts kept so reconnecting websocket clients can catch up without a snapshot
+SYNC_HISTORY_BYTES = 16 * 1024 * 1024  # approximate cap on the memory those broadcasts take up
+SERIES_VIEWS = ('area', 'bar')  # views whose numeric list data is kept as a Series and downsampled for browsers
+
+
+@dataclass(frozen=True)
+class Subscription:
+    """
+    The entries a websocket client (or an `/api/entries` request) is interested in: those in any of `channels`, and those whose
+    id starts with any of `prefixes`. Hashable, so clients with the same subscription share the broadcasts filtered for it
+    """
+    channels: frozenset = frozenset()
+    prefixes: tuple = ()
+
+    @classmethod
+    def create(cls, channels=(), prefixes=()) -> Optional['Subscription']:
+        # returns None, meaning every entry, if neither channels nor prefixes are given
+        # a single channel or prefix (e.g. `"channels": "team-a"` in a subscribe message) is taken as a list of one
+        as_list = lambda values: values if isinstance(values, (list, tuple, set, frozenset)) else [values]
+        channels = frozenset(str(channel) for channel in as_list(channels) if channel not in (None, ''))
+        prefixes = tuple(sorted(set(str(prefix) for prefix in as_list(prefixes) if prefix not in (None, ''))))
+        return cls(channels, prefixes) if channels or prefixes else None
+
+    @classmethod
+    def from_query(cls, path: str) -> Optional['Subscription']:
+        # e.g. `/?channel=team-a&channel=team-b&prefix=job-`; comma-separated lists work too
+        query = parse_qs(urlsplit(path).query)
+        split = lambda values: [item for value in values for item in value.split(',')]
+        return cls.create(split(query.get('channel', [])), split(query.get('prefix', [])))
+
+    def matches(self, channel: Optional[str], id) -> bool:
+        return channel in self.channels or str(id).startswith(self.prefixes)
+
+    def matches_update(self, update: dict) -> bool:
+        # clears, and anything else that isn't about a single entry, go to everyone
+        return 'id' not in update or update.get('data') == '___clear___' or self.matches(update.get('channel'), update['id'])
+
+
+class BroadcastMessage:
+    """
+    A message for websocket clients, serialized once; each kind of frame for it is built the first time a client needs it and
+    then shared by every other client that needs the same kind
+    The payload is kept as parts (see `to_json_parts`), so spilled entries are written out straight from the blob store
+    """
+    PARTIAL = object()  # see `for_subscription`
+
+    def __init__(self, message):
+        self.seq = message['seq']
+        self.parts = to_json_parts(message, downsample=True)
+        self.length = sum(len(part) for part in self.parts)
+        self._frame = None
+        self._deflated_frame = None
+        self._routes = [{'id': update['id'], 'channel': update.get('channel')} if 'id' in update and update.get('data') != '___clear___' else {} for update in message['updates']]
+        self._filtered = {}  # the message as each subscription sees it; see `for_subscription`
+
+    def for_subscription(self, subscription: Optional[Subscription], updates: Optional[list] = None):
+        """
+        Returns the message as a client with `subscription` sees it: this message if every update matches, None if none do, or
+        a message with just the matching ones, which is built from `updates` (the list this message was made from) and kept for
+        the next client with the same subscription
+        The list can only be passed while its entries are unchanged, i.e. when broadcasting; after that a partial match that
+        wasn't built then returns PARTIAL
+        """
+        if subscription is None:
+            return self
+        if subscription not in self._filtered:
+            matches = [subscription.matches_update(route) for route in self._routes]
+            if all(matches):
+                self._filtered[subscription] = self
+            elif not any(matches):
+                self._filtered[subscription] = None
+            elif updates is None:
+                return self.PARTIAL
+            else:
+                self._filtered[subscription] = BroadcastMessage({'seq': self.seq, 'updates': [update for update, match in zip(updates, matches) if match]})
+        return self._filtered[subscription]
+
+    def frame_for(self, deflate: Optional[PerMessageDeflate], compression_threshold: int) -> list:
+        # returns the frame as a list of parts to write out in order
+        if deflate is None or self.length < compression_threshold:
+            if self._frame is None:
+                self._frame = [encode_websocket_frame_header(self.length), *self.parts]
+            return self._frame
+        if not deflate.is_shareable:
+            return [encode_websocket_frame(deflate.compress(self.parts), compressed=True)]  # depends on what this client was sent before
+        if self._deflated_frame is None:
+            self._deflated_frame = [encode_websocket_frame(deflate.compress(self.parts), compressed=True)]
+        return self._deflated_frame
+
+
+class WebSocketSubscriber:
+    """
+    A connected browser and the messages waiting to be written to it
+    Each subscriber is written to by its own task, so a slow client only ever delays itself
+    """
+    def __init__(self, writer, deflate: Optional[PerMessageDeflate] = None, max_queue_size: int = WEBSOCKET_QUEUE_SIZE, subscription: Optional[Subscription] = None):
+        self.writer = writer
+        self.deflate = deflate  # set if the client negotiated permessage-deflate
+        self.subscription = subscription  # the entries this client receives; None for all of them
+        self.max_queue_size = max_queue_size
+        self.queue = collections.deque()  # (sequence number, BroadcastMessage) pairs yet to be written, oldest first
+        self.needs_snapshot = False  # set when the backlog was dropped; the next write sends the full state instead
+        self.delivered_seq = 0  # sequence number of the last broadcast this client has been sent, or was already up to date with
+        self.skipped_seq = 0  # sequence number of the last broadcast with nothing in it for this client
+        self.wakeup = asyncio.Event()  # set whenever there is something to write
+        self.task = None  # the writer task
+
+    def enqueue(self, seq: int, message: BroadcastMessage):
+        if self.needs_snapshot:
+            return  # the pending snapshot will already include this
+        if len(self.queue) >= self.max_queue_size:
+            # too far behind to be worth replaying; a snapshot is smaller than the backlog and brings the client up to date in one go
+            self.queue.clear()
+            self.needs_snapshot = True
+        else:
+            self.queue.append((seq, message))
+        self.wakeup.set()
+
+    def skip(self, seq: int):
+        # the writer counts the client as up to date with it once everything queued before it has been written
+        self.skipped_seq = seq
+        self.wakeup.set()
+
+    def subscribe(self, subscription: Optional[Subscription]):
+        # what is queued was filtered for the old subscription; send the new one's entries as a snapshot instead
+        self.subscription = subscription
+        self.queue.clear()
+        self.needs_snapshot = True
+        self.wakeup.set()
 
 
 class ShellvizServer:
-    def __init__(self, port: Optional[int] = None):
+    def __init__(self, port: Optional[int] = None, socket_path: Optional[str] = None, max_entry_length: Optional[int] = None, memory_budget: Optional[int] = None,
+                 compression: Optional[bool] = None, compression_threshold: Optional[int] = None, compression_context_takeover: Optional[bool] = None,
+                 update_rate: Optional[int] = None, journal_path: Optional[str] = None, spill_threshold: Optional[int] = None,
+                 downsample_points: Optional[int] = None):
+        """
+        Args:
+            port: The TCP port to listen on; defaults to SHELLVIZ_PORT
+            socket_path: If set, also listen on a unix domain socket at this path so same-host producers can skip TCP; defaults to the path of SHELLVIZ_URL if it is a `unix://` url
+            max_entry_length: If set, list data (log lines, table rows, chart series) keeps only this many of its most recent items; defaults to SHELLVIZ_MAX_ENTRY_LENGTH
+            memory_budget: If set, the approximate number of bytes all entries may take up; the least recently updated entries are evicted to stay under it; defaults to SHELLVIZ_MEMORY_BUDGET
+            compression: Whether to compress websocket messages to browsers that support permessage-deflate; defaults to SHELLVIZ_COMPRESSION
+            compression_threshold: Messages smaller than this many bytes are sent uncompressed; defaults to SHELLVIZ_COMPRESSION_THRESHOLD
+            compression_context_takeover: Whether each connection keeps its compression window between messages, which compresses repeated updates better but costs a compressor per connection; defaults to SHELLVIZ_COMPRESSION_CONTEXT_TAKEOVER
+            update_rate: The most times per second updates are broadcast to websocket clients; updates in between are coalesced so each entry is sent once per tick. 0 broadcasts once per event loop turn; defaults to SHELLVIZ_UPDATE_RATE
+            journal_path: If set, every update is also written to this file, and entries saved there by a previous run are loaded on startup; defaults to SHELLVIZ_JOURNAL
+            spill_threshold: If set, the data of entries whose JSON encoding is at least this many bytes is moved out of the Python heap into a memory-mapped blob store; defaults to SHELLVIZ_SPILL_THRESHOLD
+            downsample_points: The most points of an area or bar chart's numeric series sent to browsers; longer series are kept in full but sent as the minimum and maximum of equal slices. Falsy sends every point; defaults to SHELLVIZ_DOWNSAMPLE_POINTS
+        """
         self.port = port if port is not None else SHELLVIZ_PORT
+        self.socket_path = socket_path if socket_path is not None else get_unix_socket_path(SHELLVIZ_URL)
+        self.max_entry_length = max_entry_length if max_entry_length is not None else SHELLVIZ_MAX_ENTRY_LENGTH
+        self.memory_budget = memory_budget if memory_budget is not None else SHELLVIZ_MEMORY_BUDGET
+        self.compression = compression if compression is not None else SHELLVIZ_COMPRESSION
+        self.compression_threshold = compression_threshold if compression_threshold is not None else SHELLVIZ_COMPRESSION_THRESHOLD
+        self.compression_context_takeover = compression_context_takeover if compression_context_takeover is not None else SHELLVIZ_COMPRESSION_CONTEXT_TAKEOVER
+        self.update_rate = update_rate if update_rate is not None else SHELLVIZ_UPDATE_RATE
+        self.journal_path = journal_path if journal_path is not None else SHELLVIZ_JOURNAL
+        self.spill_threshold = spill_threshold if spill_threshold is not None else SHELLVIZ_SPILL_THRESHOLD
+        self.downsample_points = downsample_points if downsample_points is not None else SHELLVIZ_DOWNSAMPLE_POINTS
+        # Compiled python package will have a `dist` folder in the same directory as the package; this can be overridden by setting the `CLIENT_DIST_PATH` environment variable
+        self.client_dist_path = os.environ.get('CLIENT_DIST_PATH', os.path.join(os.path.dirname(__file__), 'static', 'shellviz'))
+        self.assets = StaticAssets(self.client_dist_path)  # the client's files, loaded into memory when the server starts
         
-        self.entries = []  # store a list of all existing entries; client will show these entries on page load
-        self.pending_entries = []  # store a list of all pending entries that have yet to be sent via websocket connection
+        self.entries = {}  # all existing entries keyed by id, in insertion order; client will show these entries on page load
+        self.entry_sizes = collections.OrderedDict()  # approximate size in bytes of each entry, least recently updated first; only tracked when there is a memory budget
+        self.memory_used = 0  # sum of `entry_sizes`
+        self.trimmed_items = 0  # number of list items dropped from entries because of `max_entry_length`
+        self.evicted_entries = 0  # number of entries evicted because of `memory_budget`
+        self.broadcast_seq = 0  # sequence number of the most recent broadcast; each broadcast message is numbered in order
+        self.delivered_seq = 0  # every broadcast up to this sequence number has been sent to all connected websocket clients
+        self.undelivered_from = 0  # if set, the first broadcast made while no websocket client was connected; the next client to connect is sent a snapshot
+        self.delivered_condition = threading.Condition()  # notified when `delivered_seq` advances, for `wait` on other threads
+        self.delivery_waiters = []  # (sequence number, future) pairs for `wait_async` calls on the loop thread
+        self.pending_updates = {}  # messages waiting for the next broadcast tick, keyed by entry id; see `_queue_update`
+        self.history = collections.deque()  # (sequence number, BroadcastMessage) pairs for the most recent broadcasts, oldest first
+        self.history_bytes = 0  # total payload size of `history`
+        self.blobs = BlobStore() if self.spill_threshold else None  # holds the data of large entries; see `_spill_entry`
+        self._flush_handle = None  # the scheduled `_flush_updates` call, if any
+        self._last_flush = 0  # loop time of the last `_flush_updates`
         self.is_initialized = False  # flag to track if server is fully initialized
         self.initialized_event = threading.Event()  # thread-safe event for initialization
 
         self.loop = asyncio.new_event_loop() # the event loop that is attached to the thread created for this instance; new `create_task` async methods are added to the loop
         self.server_task = None # keeps track of http/websocket server task that is triggered by the asyncio.create_task method so it can be cancelled on `shutdown`
+        self.thread = None # the background thread running `loop`
+
+        self.websocket_clients = set() # a WebSocketSubscriber for each connected websocket client
+
+        self.inbox = collections.deque() # entries (and clears) handed over by `send_threadsafe` and `clear_threadsafe` from other threads, waiting to be applied on the loop thread
+        self._inbox_scheduled = False # whether a `_drain_inbox` call is already scheduled on the loop
 
-        self.websocket_clients = set() # set of all connected websocket clients
+        self.journal = None # the Journal updates are written to, if `journal_path` is set
+        if self.journal_path:
+            self._replay_journal()
+            self.journal = Journal(self.journal_path)
 
         atexit.register(self.shutdown)  # Register cleanup at program exit
 
@@ -36,7 +230,8 @@ class ShellvizServer:
     def start(self):
         self.server_task = self.loop.create_task(self.start_server()) # runs `start_server` asynchronously and stores the task object in `server_task` so it can be canclled on `shutdown`
         
-        threading.Thread(target=self._run_event_loop, daemon=True).start()  # Run loop in background thread; daemon=True ensures that the thread is killed when the main thread exits
+        self.thread = threading.Thread(target=self._run_event_loop, daemon=True)  # Run loop in background thread; daemon=True ensures that the thread is killed when the main thread exits
+        self.thread.start()
 
     def _run_event_loop(self):
         
@@ -50,17 +245,33 @@ class ShellvizServer:
         if self.server_task:
             self.server_task.cancel()
 
+        stopped_event = threading.Event()
+
         def _shutdown_loop():
+            if self.pending_updates:
+                self._flush_updates()  # so that they make it into the journal
+
             # Gather all tasks to ensure they are canceled
             pending_tasks = asyncio.all_tasks(loop=self.loop)
             for task in pending_tasks:
                 task.cancel()
 
-            # Schedule closing the loop after tasks are cancelled
-            self.loop.call_soon_threadsafe(self.loop.stop)
+            # Let the cancelled tasks unwind (closing any open keep-alive connections) before stopping the loop
+            async def _stop_loop():
+                await asyncio.gather(*pending_tasks, return_exceptions=True)
+                self.loop.stop()
+                stopped_event.set()
+            self.loop.create_task(_stop_loop())
+
+        if self.loop.is_closed() or not self.loop.is_running():
+            return
 
         # Schedule the shutdown on the event loop's thread
         self.loop.call_soon_threadsafe(_shutdown_loop)
+        if threading.current_thread() is not self.thread:
+            stopped_event.wait(timeout=1)
+            if self.journal:
+                self.journal.close()  # writes out anything still queued
 
     def __del__(self):
         self.shutdown()  # Ensure cleanup if object is deleted
@@ -68,115 +279,228 @@ class ShellvizServer:
 
     # -- Commands to initialize and handle HTTP & WebSocket connections --
     async def start_server(self):
-        server = await asyncio.start_server(self.handle_connection, '0.0.0.0', self.port)  # start the tcp server on the specified host and port
+        servers = [await asyncio.start_server(self.handle_connection, '0.0.0.0', self.port)]  # start the tcp server on the specified host and port
+
+        if self.socket_path:
+            # listen on a unix domain socket as well; browsers still connect over tcp, but local producers can skip it
+            if os.path.exists(self.socket_path) and stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                os.unlink(self.socket_path)  # left behind by a server that did not shut down cleanly
+            servers.append(await asyncio.start_unix_server(self.handle_connection, path=self.socket_path))
 
         self.is_initialized = True  # mark server as initialized once it's ready to accept connections
         self.initialized_event.set()  # signal that initialization is complete
 
-        async with server:
-            await server.serve_forever() # server will run indefinitely until the method's task is `.cancel()`ed
+        # read and compress the client's files off the loop; until they are loaded, requests for them are served from disk
+        self.loop.run_in_executor(None, self.assets.load)
 
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in servers)) # servers will run indefinitely until the method's task is `.cancel()`ed
+        finally:
+            for server in servers:
+                server.close()
+            if self.socket_path and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
 
-    async def handle_connection(self, reader, writer):
-        # Read up to 1024 bytes to determine connection type, but do not lose them
-        data = await reader.read(1024)
-        if not data:
-            return
 
-        buffered_reader = BufferedStreamReader(data, reader)
+    async def handle_connection(self, reader, writer):
+        # every connection starts with an HTTP request; it is parsed once, and then either answered or upgraded to a websocket
+        reader = HttpRequestReader(reader, writer)
+        try:
+            request = await reader.read_request(idle_timeout=HTTP_KEEP_ALIVE_TIMEOUT)
+        except ValueError as e:
+            request = None
+            await self._write_bad_request(writer, e)
+        except (asyncio.CancelledError, ConnectionResetError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            request = None
 
-        # Check if this is a WebSocket handshake request
-        if data.startswith(b'GET / HTTP/1.1') and b'Upgrade: websocket' in data:
+        # Check if this is a WebSocket handshake request; producers stream entries in on `/api/producer`, every other path is a browser receiving them
+        if request and request.is_websocket_upgrade:
             try:
-                await self.handle_websocket_connection(buffered_reader, writer)
+                if request.path.startswith('/api/producer'):
+                    await self.handle_producer_connection(request, reader, writer)
+                else:
+                    await self.handle_websocket_connection(request, reader, writer)
             except (asyncio.CancelledError, GeneratorExit, BrokenPipeError, ConnectionResetError):
                 pass
             except Exception as e:
                 print(f"Unexpected error in handle_connection: {e}")
-        else:
+        elif request:
             try:
-                await self.handle_http(buffered_reader, writer)
-            except (asyncio.CancelledError, GeneratorExit, BrokenPipeError, ConnectionResetError):
+                # keep serving requests on this connection for as long as the client asks for keep-alive, up to HTTP_KEEP_ALIVE_MAX_REQUESTS
+                # pipelined requests are already waiting in the reader, and are answered in order
+                requests = 1
+                while await self.handle_http(request, writer, allow_keep_alive=requests < HTTP_KEEP_ALIVE_MAX_REQUESTS):
+                    request = await reader.read_request(idle_timeout=HTTP_KEEP_ALIVE_TIMEOUT)
+                    if request is None:
+                        break  # the client closed the connection
+                    requests += 1
+            except ValueError as e:
+                await self._write_bad_request(writer, e)
+            except (asyncio.CancelledError, GeneratorExit, BrokenPipeError, ConnectionResetError, asyncio.IncompleteReadError, asyncio.TimeoutError):
                 pass
             except Exception as e:
                 print(f"Unexpected error in handle_http: {e}")
 
-        # Always ensure the writer is closed
+        # Always ensure the writer is closed; an HTTP connection only once the client has read every response sent on it and closed its end
         if not writer.is_closing():
+            if not (request and request.is_websocket_upgrade):
+                try:
+                    if writer.can_write_eof():
+                        writer.write_eof()
+                    await asyncio.wait_for(reader.discard(), timeout=HTTP_LINGER_TIMEOUT)
+                except (asyncio.CancelledError, asyncio.TimeoutError, ConnectionError, OSError):
+                    pass
             writer.close()
             try:
                 await writer.wait_closed()
             except Exception:
                 pass
+
+    async def _write_bad_request(self, writer, error: ValueError):
+        # answers a malformed or oversized request with a 400; the connection is then closed, as where the next request would start is unknown
+        try:
+            await write_400(writer, str(error))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
     # -- / Commands to initialize and handle HTTP & WebSocket connections --
 
     # -- HTTP sever method --
-    async def handle_http(self, reader, writer):
-        request = await parse_request(reader)
+    async def handle_http(self, request, writer, allow_keep_alive: bool = True) -> bool:
+        """
+        Writes the response to a single request
+        Returns True if the connection should be kept open for another request; with `allow_keep_alive` False it never is, and the
+        response tells the client so
+        """
+        keep_alive = request.keep_alive and allow_keep_alive
 
-        # Compiled python package will have a `dist` folder in the same directory as the package; this can be overridden by setting the `SHELLVIZ_CLIENT_DIST_PATH` environment variable
-        CLIENT_DIST_PATH = os.environ.get('CLIENT_DIST_PATH', os.path.join(os.path.dirname(__file__), 'static', 'shellviz')) 
+        asset = self.assets.get(request.path)
 
         # Handle OPTIONS requests for CORS preflight
         if request.method == 'OPTIONS':
-            await write_cors_headers(writer)
-        elif request.path == '/':
-            # listen for request to root webpage
-            await write_file(writer, os.path.join(CLIENT_DIST_PATH, 'index.html'))
-        elif request.path == '/api/entries':
-            # listen for requests to get all entries
-            await write_json(writer, to_json_string(self.entries))
+            await write_cors_headers(writer, keep_alive=keep_alive)
+        elif asset:
+            # listen for requests to the root webpage and the client's other files
+            await write_asset(writer, asset, request.headers, keep_alive=keep_alive)
+        elif urlsplit(request.path).path == '/api/entries':
+            # listen for requests to get all entries, or with `?channel=...&prefix=...` just those of some channels or id prefixes
+            await write_json(writer, to_json_parts(self.get_entries(Subscription.from_query(request.path)), downsample=True), keep_alive=keep_alive)
+        elif request.path.startswith('/api/series/'):
+            # listen for requests for part of a downsampled series at a higher resolution, e.g. when zooming into a chart:
+            # `/api/series/<id>?start=<position>&end=<position>&points=<n>`, answered with `[position, value]` pairs
+            url = urlsplit(request.path)
+            entry = self.entries.get(unquote(url.path[len('/api/series/'):]))
+            if entry and isinstance(entry['data'], Series):
+                query = {key: int(values[0]) for key, values in parse_qs(url.query).items() if key in ('start', 'end', 'points') and values[0].isdigit()}
+                await write_json(writer, jsonFn.dumps(entry['data'].downsample(query.get('start', 0), query.get('end'), query.get('points'))), keep_alive=keep_alive)
+            else:
+                await write_404(writer, keep_alive=keep_alive)
         elif request.path == '/api/running':
             # listen for requests to check if a server is running on the specified port
-            await write_200(writer)
+            await write_200(writer, keep_alive=keep_alive)
         elif request.path.startswith('/api/delete'):
             # listen for requests to delete an entry
             entry_id = request.path.split('/')[-1]
-            self.entries = [entry for entry in self.entries if entry['id'] != entry_id]
-            await write_200(writer)
-        elif request.path == '/api/clear':
-            self.entries = []
-            self.send(value='___clear___')
-            await write_200(writer)
+            self.delete(entry_id)
+            await write_200(writer, keep_alive=keep_alive)
+        elif urlsplit(request.path).path == '/api/clear':
+            self.clear(Subscription.from_query(request.path))
+            await write_200(writer, keep_alive=keep_alive)
+        elif request.path == '/api/stats':
+            # listen for requests for retention statistics, e.g. to monitor how much is being trimmed or evicted
+            await write_json(writer, jsonFn.dumps(self.get_stats()), keep_alive=keep_alive)
         elif request.path == '/api/wait':
             # listen for requests to wait for all pending entries to be sent to the client via websocket
             # once all pending entries are sent, the server will respond with a 200 status code
-            while self.pending_entries:
-                await asyncio.sleep(0.05)  # Use asyncio.sleep instead of time.sleep
-            await write_200(writer)
+            await self.wait_async()
+            await write_200(writer, keep_alive=keep_alive)
         elif request.path == '/api/send' and request.method == 'POST':
-            # listen to requests to add new content
-            entry = jsonFn.loads(request.body)
+            # listen to requests to add new content; an entry that can't be applied (see `check_batch`) is answered with a 400
+            try:
+                entry = jsonFn.loads(request.body or b'')
+            except ValueError:
+                entry, invalid = None, (0, 'invalid JSON')
+            else:
+                invalid = self.check_batch([entry])
 
-            if entry.get('data'):
-                self.send(entry['data'], id=entry.get('id'), append=entry.get('append'), view=entry.get('view'))
-                await write_200(writer)
+            if invalid:
+                await write_400(writer, invalid[1], keep_alive=keep_alive)
+            elif entry.get('data'):
+                self.send(entry['data'], id=entry.get('id'), append=entry.get('append'), view=entry.get('view'), channel=entry.get('channel'))
+                await write_200(writer, keep_alive=keep_alive)
+            else:
+                await write_404(writer, keep_alive=keep_alive)
+        elif request.path == '/api/send_batch' and request.method == 'POST':
+            # listen to requests to add many entries at once; the body is newline-delimited JSON with one entry per line
+            # the whole body is checked before any of it is applied, so a bad line is answered with a 400 and nothing is applied
+            entries, line_numbers, error = [], [], None
+            for line_number, line in enumerate((request.body or b'').splitlines(), 1):
+                if line.strip():
+                    try:
+                        entries.append(jsonFn.loads(line))
+                    except ValueError:
+                        error = f'line {line_number}: invalid JSON'
+                        break
+                    line_numbers.append(line_number)
+            if error is None:
+                invalid = self.check_batch(entries)
+                if invalid:
+                    index, reason = invalid
+                    error = f'line {line_numbers[index]}: {reason}'
+            if error is None:
+                self.send_batch([entry for entry in entries if entry.get('data')])
+                await write_200(writer, keep_alive=keep_alive)
             else:
-                await write_404(writer)
+                await write_400(writer, error, keep_alive=keep_alive)
         else:
-            # attempt to serve any file matching the request path from the dist directory
-            relative_path = request.path.lstrip('/')
-            file_path = os.path.join(CLIENT_DIST_PATH, relative_path)
-            if os.path.isfile(file_path):
-                await write_file(writer, file_path)
+            # attempt to serve any file matching the request path from the dist directory, e.g. one added since the server started
+            relative_path = request.path.split('?', 1)[0].lstrip('/') or 'index.html'
+            file_path = os.path.realpath(os.path.join(self.client_dist_path, relative_path))
+            if file_path.startswith(os.path.realpath(self.client_dist_path) + os.sep) and os.path.isfile(file_path):
+                await write_file(writer, file_path, keep_alive=keep_alive)
             else:
-                await write_404(writer)
+                await write_404(writer, keep_alive=keep_alive)
+
+        return keep_alive
     # -- / HTTP server method --
 
     # -- WebSocket server methods --
-    async def handle_websocket_connection(self, reader, writer):
+    async def handle_websocket_connection(self, request, reader, writer):
+        """
+        A browser receiving updates. Every message sent to it is numbered: `{"seq": <n>, "updates": [...]}`
+        A browser reconnecting with `?since=<n>` (the last `seq` it received) is sent only the broadcasts it missed, or a snapshot of
+        every entry if they are no longer in `history`; one connecting without it is assumed to have just loaded `/api/entries`
+        A browser can limit what it is sent to some channels or id prefixes (see `Subscription`), with `?channel=...&prefix=...` or
+        by sending `{"op": "subscribe", "channels": [...], "prefixes": [...]}`, which is answered with a snapshot of those entries
+        """
+        subscriber = None
         try:
-            await perform_websocket_handshake(reader, writer)
-            self.websocket_clients.add(writer)
-            asyncio.run_coroutine_threadsafe(self.send_pending_entries_to_websocket_clients(), self.loop)
+            deflate = await perform_websocket_handshake(request, writer, compression=self.compression, context_takeover=self.compression_context_takeover)
+            subscriber = WebSocketSubscriber(writer, deflate=deflate, subscription=Subscription.from_query(request.path))
+            since = parse_qs(urlsplit(request.path).query).get('since', [''])[0]
+            if since.isdigit():
+                since = int(since)
+            elif self.undelivered_from:
+                since = self.undelivered_from - 1  # entries were sent before anyone was watching; this client takes them over so `wait` can return
+            else:
+                since = self.broadcast_seq
+            self.undelivered_from = 0
+            self._resume_websocket_client(subscriber, since)
+            self.websocket_clients.add(subscriber)
+            subscriber.task = self.loop.create_task(self.write_to_websocket_client(subscriber))
             try:
                 while True:
                     try:
-                        message = await receive_websocket_message(reader)
+                        message = await receive_websocket_message(reader, timeout=2 * WEBSOCKET_PING_INTERVAL, deflate=subscriber.deflate, writer=writer)
                         if message is None:
                             break # [WebSocket] received None, connection likely closed"
                         elif message == "":
                             continue # [WebSocket] received empty message, continuing"
+                        try:
+                            payload = jsonFn.loads(message)
+                        except ValueError:
+                            continue  # browsers only send control messages; ignore anything else
+                        if isinstance(payload, dict) and payload.get('op') == 'subscribe':
+                            subscriber.subscribe(Subscription.create(payload.get('channels'), payload.get('prefixes')))
                     except (asyncio.CancelledError, GeneratorExit, ConnectionResetError, BrokenPipeError):
                         break # [WebSocket] disconnect or cancellation"
                     except Exception as e:
@@ -184,7 +508,10 @@ class ShellvizServer:
             except Exception as e:
                 pass # [WebSocket] error in message loop"
         finally:
-            self.websocket_clients.discard(writer)
+            if subscriber:
+                self._remove_websocket_client(subscriber)
+                if subscriber.task:
+                    subscriber.task.cancel()
             if not writer.is_closing():
                 writer.close()
                 try:
@@ -192,76 +519,594 @@ class ShellvizServer:
                 except Exception:
                     pass
 
-    async def send_pending_entries_to_websocket_clients(self):
-        if not self.websocket_clients:
-            return # No clients to send to
-
-        while self.pending_entries:
-            entry = self.pending_entries.pop(0)
-            value = to_json_string(entry)
-            disconnected_clients = set()
-            
-            for writer in self.websocket_clients:
+    async def handle_producer_connection(self, request, reader, writer):
+        """
+        A long-lived websocket over which a producer streams entries, one JSON message per frame:
+            an entry dict (`data`, `id`, `view`, `append`, `channel`) or a list of entries, applied in order
+            {"op": "clear"} to clear all entries, or {"op": "clear", "channel": <channel>} to clear one channel's
+            {"op": "wait", "id": <n>}, answered with {"op": "ack", "id": <n>} once everything before it has been sent to websocket clients
+        """
+        try:
+            await perform_websocket_handshake(request, writer)
+            while True:
+                message = await receive_websocket_message(reader, timeout=None, writer=writer)  # producers may go quiet for long stretches; don't time them out
+                if message is None:
+                    break
+                elif message == "":
+                    continue
+
+                # a bad message is skipped rather than dropping the connection, and everything streamed after it with it
                 try:
-                    await send_websocket_message(writer, value)
-                except (ConnectionResetError, BrokenPipeError, ConnectionError):
-                    # Client disconnected, mark for removal
-                    disconnected_clients.add(writer)
-                except Exception as e:
-                    # Log other errors but don't crash
-                    print(f"Error sending WebSocket message: {e}")
-                    disconnected_clients.add(writer)
-            
-            # Remove disconnected clients
-            self.websocket_clients -= disconnected_clients
-            for writer in disconnected_clients:
+                    payload = jsonFn.loads(message)
+                except ValueError:
+                    print('Shellviz: skipped a producer message that is not valid JSON')
+                    continue
+                invalid = self.check_batch(payload if isinstance(payload, list) else [payload])
+                if invalid:
+                    index, reason = invalid
+                    print(f'Shellviz: skipped a producer message: {f"item {index}: " if isinstance(payload, list) else ""}{reason}')
+                    continue
+
+                if isinstance(payload, list):
+                    self.send_batch([entry for entry in payload if entry.get('data')])
+                elif payload.get('op') == 'clear':
+                    self.clear(Subscription.create([payload.get('channel')]))
+                elif payload.get('op') == 'wait':
+                    await self.wait_async()
+                    await send_websocket_message(writer, jsonFn.dumps({'op': 'ack', 'id': payload.get('id')}))
+                elif payload.get('data'):
+                    self.send(payload['data'], id=payload.get('id'), append=payload.get('append'), view=payload.get('view'), channel=payload.get('channel'))
+        finally:
+            if not writer.is_closing():
+                writer.close()
                 try:
-                    writer.close()
                     await writer.wait_closed()
                 except Exception:
                     pass
 
+    async def write_to_websocket_client(self, subscriber: WebSocketSubscriber):
+        """
+        Writes a subscriber's queued messages to it, one at a time, for as long as it stays connected
+        A client that can't accept a message within WEBSOCKET_DRAIN_TIMEOUT is disconnected; the browser reconnects and reloads
+        An idle client is pinged every WEBSOCKET_PING_INTERVAL, so its pongs keep the read loop (and any proxies) from timing it out
+        """
+        writer = subscriber.writer
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), timeout=WEBSOCKET_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(encode_websocket_frame(b'', opcode=0x9))
+                    await asyncio.wait_for(writer.drain(), timeout=WEBSOCKET_DRAIN_TIMEOUT)
+                    continue
+                subscriber.wakeup.clear()
+                while subscriber.queue or subscriber.needs_snapshot:
+                    if subscriber.needs_snapshot:
+                        if self.pending_updates:
+                            self._flush_updates()  # so the snapshot is exactly the state as of `broadcast_seq`
+                        subscriber.needs_snapshot = False
+                        seq = self.broadcast_seq
+                        messages = [BroadcastMessage({'seq': seq, 'updates': [{'op': 'snapshot', 'entries': self.get_entries(subscriber.subscription)}]})]
+                    else:
+                        # write everything that has queued up since the last drain in one go
+                        seq = subscriber.queue[-1][0]
+                        messages = [message for _, message in subscriber.queue]
+                        subscriber.queue.clear()
+                    writer.writelines([part for message in messages for part in message.frame_for(subscriber.deflate, self.compression_threshold)])
+                    await asyncio.wait_for(writer.drain(), timeout=WEBSOCKET_DRAIN_TIMEOUT)
+                    subscriber.delivered_seq = seq
+                    self._update_delivered_seq()
+                if subscriber.skipped_seq > subscriber.delivered_seq:
+                    # everything broadcast since the last write had nothing in it for this client
+                    subscriber.delivered_seq = subscriber.skipped_seq
+                    self._update_delivered_seq()
+        except Exception:  # timed out draining, disconnected, or otherwise unable to write
+            self._remove_websocket_client(subscriber)
+            writer.close()  # ends the read loop in `handle_websocket_connection`, which cleans up the rest
+
+    def _resume_websocket_client(self, subscriber: WebSocketSubscriber, since: int):
+        # queue what a client that has seen every broadcast up to `since` needs to catch up
+        subscriber.delivered_seq = since
+        missed = [(seq, message) for seq, message in self.history if seq > since]
+        if since == self.broadcast_seq:
+            # nothing missed; tell the client where the stream is, so it can resume from here if it is disconnected before the next broadcast
+            subscriber.queue.append((since, BroadcastMessage({'seq': since, 'updates': []})))
+        elif since > self.broadcast_seq or not missed or missed[0][0] != since + 1 or len(missed) > subscriber.max_queue_size:
+            subscriber.needs_snapshot = True  # too far behind, or from before this server started
+        else:
+            for seq, message in missed:
+                message = message.for_subscription(subscriber.subscription)
+                if message is BroadcastMessage.PARTIAL:
+                    subscriber.subscribe(subscriber.subscription)  # can't be rebuilt for this client now; send it a snapshot
+                    break
+                elif message:
+                    subscriber.queue.append((seq, message))
+                else:
+                    subscriber.skipped_seq = seq
+        subscriber.wakeup.set()
+
+    def _remove_websocket_client(self, subscriber: WebSocketSubscriber):
+        if subscriber not in self.websocket_clients:
+            return
+        self.websocket_clients.discard(subscriber)
+        if not self.websocket_clients and subscriber.delivered_seq < self.broadcast_seq:
+            # the last client left before it was sent everything; hand the remainder to the next client to connect
+            self.undelivered_from = subscriber.delivered_seq + 1
+        self._update_delivered_seq()
+
+    def _update_delivered_seq(self):
+        # recompute how far every connected client has been sent, and release any `wait` calls that are now satisfied
+        delivered_seq = min([subscriber.delivered_seq for subscriber in self.websocket_clients], default=self.broadcast_seq)
+        if self.undelivered_from:
+            delivered_seq = min(delivered_seq, self.undelivered_from - 1)
+        if delivered_seq <= self.delivered_seq:
+            return
+
+        with self.delivered_condition:
+            self.delivered_seq = delivered_seq
+            self.delivered_condition.notify_all()
+        waiters = []
+        for seq, future in self.delivery_waiters:
+            if seq > delivered_seq:
+                waiters.append((seq, future))
+            elif not future.done():
+                future.set_result(None)
+        self.delivery_waiters = waiters
+
     # -- / WebSocket server methods --
 
-    def send(self, value, id: str = None, view: Optional[str] = None, append: bool = False, wait: bool = False):
-        existing_entry_index = next((i for i, item in enumerate(self.entries) if item['id'] == id), -1) if id else -1
-        if existing_entry_index >= 0:
+    def send(self, value, id: str = None, view: Optional[str] = None, append: bool = False, wait: bool = False, channel: Optional[str] = None):
+        _, message = self._apply_entry(value, id=id, view=view, append=append, channel=channel)
+        self._queue_update(message)
+
+        if wait:
+            self.wait()
+
+    def send_batch(self, entries: list, wait: bool = False):
+        """
+        Applies a list of entries (dicts with `data`, `id`, `view`, `append` and `channel` keys) in order
+        They are broadcast together on the next tick, so an entry updated several times within the batch is only sent once
+        """
+        for item in entries:
+            _, message = self._apply_entry(item['data'], id=item.get('id'), view=item.get('view'), append=item.get('append'), channel=item.get('channel'))
+            self._queue_update(message)
+
+        if wait:
+            self.wait()
+
+    def check_batch(self, entries: list) -> Optional[tuple]:
+        """
+        Checks a batch of entries before `send_batch` applies any of them, so that a bad one doesn't leave those before it applied
+        and the rest not; returns (index, reason) for the first entry that can't be applied, or None if they all can
+        An append is checked against the type the entry's data will have once the earlier entries in the batch are applied
+        """
+        data_types = {}  # id -> type of its data, for ids set earlier in the batch
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                return index, 'expected a JSON object'
+            for key in ('id', 'view', 'channel'):
+                if isinstance(entry.get(key), (list, dict)):
+                    return index, f'`{key}` must be a string'
+            value, id = entry.get('data'), entry.get('id')
+            if not value or id is None:
+                continue  # ignored, or a new entry of its own
+            current = data_types[id] if id in data_types else self._get_data_type(id)
+            if entry.get('append') and current is str and not isinstance(value, str):
+                return index, f'cannot append {type(value).__name__} data to a string'
+            # see `append_data`: lists and strings are appended to and dicts updated with dicts; anything else is replaced
+            appended = entry.get('append') and (current in (list, str) or (current is dict and isinstance(value, dict)))
+            data_types[id] = current if appended else type(value)
+        return None
+
+    def _get_data_type(self, id: str) -> Optional[type]:
+        # the type of an entry's data as `append_data` sees it, or None if there is no entry (or its data is empty)
+        entry = self.entries.get(id)
+        if not entry or not entry['data']:
+            return None
+        data = entry['data']
+        return data.kind if isinstance(data, Blob) else list if isinstance(data, Series) else type(data)
+
+    def send_threadsafe(self, value, id: str = None, view: Optional[str] = None, append: bool = False, channel: Optional[str] = None):
+        """
+        Hands an entry to the server from any thread in this process without going through HTTP
+        Entries are queued and applied in order on the loop thread; entries that pile up between loop turns are applied as a single batch
+        """
+        self._put_inbox({'data': value, 'id': id, 'view': view, 'append': append, 'channel': channel})
+
+    def clear_threadsafe(self, subscription: Optional[Subscription] = None):
+        """
+        Clears entries (those matching `subscription`, or all of them) from any thread in this process, in order with the entries
+        handed over by `send_threadsafe`: entries sent before it are cleared, and entries sent after it are kept
+        """
+        self._put_inbox({'op': 'clear', 'subscription': subscription})
+
+    def _put_inbox(self, item: dict):
+        self.inbox.append(item)
+        if not self._inbox_scheduled:
+            self._inbox_scheduled = True
+            self.loop.call_soon_threadsafe(self._drain_inbox)
+
+    def _drain_inbox(self):
+        self._inbox_scheduled = False  # reset before draining so that entries added while draining schedule another pass
+        while self.inbox:
+            item = self.inbox.popleft()
+            if item.get('op') == 'clear':
+                self.clear(item['subscription'])
+                continue
+            # checked one at a time, so that a bad entry is skipped without losing the others drained with it
+            invalid = self.check_batch([item])
+            if invalid:
+                print(f'Shellviz: skipped entry {item.get("id")}: {invalid[1]}')
+                continue
+            _, message = self._apply_entry(item['data'], id=item.get('id'), view=item.get('view'), append=item.get('append'), channel=item.get('channel'))
+            self._queue_update(message)
+
+    def _apply_entry(self, value, id: str = None, view: Optional[str] = None, append: bool = False, channel: Optional[str] = None):
+        """
+        Creates or updates the entry with the given id; an entry stays in the `channel` it was created in
+        Returns a tuple of (entry, message), where message is what websocket clients need to apply the change: usually the entry itself,
+        but for an append they can replay locally it is an `append` op carrying only the new data, e.g.
+            {'op': 'append', 'id': 'log', 'view': 'log', 'data': [...new lines...], 'version': 42}
+        `version` counts updates to the entry, so a client holding version 41 knows it can apply the append and anything else needs a resync
+        """
+        entry = self.entries.get(id) if id else None
+        if entry:
+            message = entry
+            appended_size = None  # size of the appended data, when it can simply be added to the entry's tracked size
+            spilled = entry['data'] if isinstance(entry['data'], Blob) else None
+            series = entry['data'] if isinstance(entry['data'], Series) else None
+            if append and spilled and self._can_extend(spilled, value):
+                # append to the spilled data without decoding it
+                entry['data'] = self.blobs.extend(spilled, value)
+            elif append and series and view in SERIES_VIEWS and series.can_extend(value):
+                value = value if isinstance(value, list) else [value]  # a single point; browsers and the journal are sent a list to append
+                series.extend(value)  # straight into the array
+            else:
+                spilled = series = None
+            if spilled or series:
+                entry['view'] = view
+                entry['version'] += 1
+                message = self._append_message(entry, view, value, entry['version'])
+                self._trim_entry(entry)
+                if self.memory_budget:
+                    self._track_entry_size(id, entry['data'].size)
+                return entry, message
+            # browsers only hold a downsampled copy of a long series, so an append to one is sent as the whole entry
+            downsampled = isinstance(entry['data'], Series) and len(entry['data']) > self.downsample_points
+            if isinstance(entry['data'], Blob) and append:
+                entry['data'] = entry['data'].load()  # e.g. a dict update; it is spilled again when it is next broadcast
+            elif isinstance(entry['data'], Series):
+                entry['data'] = entry['data'].values.tolist()  # replaced, or appended to with something other than numbers
             if append:
+                if is_replayable_append(entry['data'], value) and not downsampled:
+                    message = self._append_message(entry, view, value, entry['version'] + 1)
+                    if self.memory_budget and isinstance(value, (list, str)):
+                        appended_size = get_json_size(value)
                 # if an existing entry is found and append is true, append the new data to the existing entry
-                value = append_data(self.entries[existing_entry_index]['data'], value)
-            self.entries[existing_entry_index]['data'] = value
-            self.entries[existing_entry_index]['view'] = view
+                value = append_data(entry['data'], value)
+            entry['data'] = value
+            entry['view'] = view
+            entry['version'] += 1
+            self._series_entry(entry)
 
-            # add to list of pending entries that should be sent the client via websocket
-            entry = self.entries[existing_entry_index]
+            trimmed_size = self._trim_entry(entry)
+            if self.memory_budget:
+                size = self.entry_sizes.get(id, 0) + appended_size - trimmed_size if appended_size is not None else get_json_size(value)
+                self._track_entry_size(id, size)
 
         else:
-            id = id or str(time.time())
+            id = id or self._generate_entry_id()
             entry = {
                 'id': id,
                 'data': value,
                 'view': view,
+                'version': 1,
             }
+            if channel is not None:
+                entry['channel'] = channel
+            message = entry
 
             if value == '___clear___':
                 # don't store clear requests in the entries list; we only want to send them to the client via websocket
                 pass
             else:
-                # store the entry in the entries list
-                self.entries.append(entry)
+                # store the entry in the entries index
+                self.entries[id] = entry
+                self._series_entry(entry)
+                self._trim_entry(entry)
+                if self.memory_budget:
+                    self._track_entry_size(id, self._get_entry_size(entry))
 
-        # add to list of pending entries that should be sent the client via websocket and send them to the client via websocket
-        self.pending_entries.append(entry)
-        asyncio.run_coroutine_threadsafe(self.send_pending_entries_to_websocket_clients(), self.loop)
+        return entry, message
 
-        if wait:
-            self.wait()
-    
-    def clear(self):
+    def _append_message(self, entry, view: Optional[str], value, version: int) -> dict:
+        # an `append` op carrying only the data appended to an entry, for clients holding the version before `version`
+        message = {'op': 'append', 'id': entry['id'], 'view': view, 'data': value, 'version': version}
+        if 'channel' in entry:
+            message['channel'] = entry['channel']  # for routing to subscribers
+        if self.max_entry_length and isinstance(value, list):
+            message['max_length'] = self.max_entry_length  # so clients trim their copy the same way
+        return message
+
+    def _series_entry(self, entry):
+        # keeps the numeric list data of a chart in an array, from which browsers are sent a downsampled copy; see `Series`
+        if self.downsample_points and entry['view'] in SERIES_VIEWS and isinstance(entry['data'], list):
+            entry['data'] = Series.create(entry['data'], self.downsample_points) or entry['data']
+
+    def _client_update(self, update):
+        # the update as browsers are sent it: an append to a series that is too long to send in full is sent as the whole
+        # (downsampled) entry instead, since browsers only hold a downsampled copy to append to
+        if update.get('op') != 'append':
+            return update
+        entry = self.entries.get(update['id'])
+        if entry and isinstance(entry['data'], Series) and len(entry['data']) > self.downsample_points:
+            return entry
+        return update
+
+    def _is_current(self, message) -> bool:
+        # whether a message produced by `_apply_entry` still refers to a stored entry
+        if message.get('op') == 'append':
+            return message['id'] in self.entries
+        return self.entries.get(message['id']) is message
+
+    def _trim_entry(self, entry) -> int:
+        """
+        Drops the oldest items of an entry's list data beyond `max_entry_length`
+        Returns the approximate size of the dropped items when a memory budget is being tracked
+        """
+        data = entry['data']
+        if isinstance(data, Blob):
+            if not self.max_entry_length or data.count <= self.max_entry_length:
+                return 0  # `count` is only set for lists
+            excess = data.count - self.max_entry_length
+            entry['data'] = self.blobs.trim(data, excess)
+            self.trimmed_items += excess
+            return data.size - entry['data'].size
+        if isinstance(data, Series):
+            if not self.max_entry_length or len(data) <= self.max_entry_length:
+                return 0
+            excess = len(data) - self.max_entry_length
+            data.trim(excess)
+            self.trimmed_items += excess
+            return excess * data.values.itemsize
+        if not self.max_entry_length or not isinstance(data, list) or len(data) <= self.max_entry_length:
+            return 0
+        excess = len(data) - self.max_entry_length
+        trimmed_size = get_json_size(data[:excess]) if self.memory_budget else 0
+        del data[:excess]
+        self.trimmed_items += excess
+        return trimmed_size
+
+    def _spill_entry(self, entry) -> Optional[Blob]:
+        """
+        Moves an entry's data into the blob store if its JSON encoding is at least `spill_threshold` bytes, leaving only the
+        entry's metadata on the Python heap; it is then served to clients straight from the store without being decoded
+        Entries are spilled when they are broadcast, so one updated many times within a tick is only serialized once
+        Returns the entry's Blob if its data is spilled
+        """
+        data = entry['data']
+        if isinstance(data, Blob):
+            return data
+        if not self.blobs or estimate_json_size(data) < self.spill_threshold:
+            return None
+        blob = self.blobs.put(data, min_size=self.spill_threshold, offsets=bool(self.max_entry_length))  # lists are only trimmed with a max length
+        if blob:
+            entry['data'] = blob
+        return blob
+
+    def _can_extend(self, blob: Blob, value) -> bool:
+        # whether appending `value` to spilled data is a plain concatenation (see `is_replayable_append`)
+        return blob.kind in (list, str) and isinstance(value, blob.kind) and blob.length > 0
+
+    def _get_entry_size(self, entry) -> int:
+        data = entry['data']
+        return data.size if isinstance(data, (Blob, Series)) else get_json_size(data)
+
+    def _track_entry_size(self, id: str, size: int):
+        # record the entry as the most recently updated, then evict the least recently updated entries until we are back under budget
+        self.memory_used += size - self.entry_sizes.pop(id, 0)
+        self.entry_sizes[id] = size
+        while self.memory_used > self.memory_budget and len(self.entry_sizes) > 1:
+            evicted_id, evicted_size = self.entry_sizes.popitem(last=False)
+            self.memory_used -= evicted_size
+            evicted = self.entries.pop(evicted_id, None)
+            self.evicted_entries += 1
+            self._queue_update(self._delete_message(evicted_id, evicted))
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'memory_used': self.memory_used if self.memory_budget else None,
+            'memory_budget': self.memory_budget,
+            'max_entry_length': self.max_entry_length,
+            'trimmed_items': self.trimmed_items,
+            'evicted_entries': self.evicted_entries,
+            'spilled_entries': sum(1 for entry in self.entries.values() if isinstance(entry['data'], Blob)),
+            'spilled_bytes': sum(entry['data'].size for entry in self.entries.values() if isinstance(entry['data'], Blob)),
+        }
+
+    def _generate_entry_id(self) -> str:
+        # ids are timestamps; disambiguate entries created within the same clock tick so they don't overwrite each other
+        id = base_id = str(time.time())
+        suffix = 0
+        while id in self.entries:
+            suffix += 1
+            id = f'{base_id}-{suffix}'
+        return id
+
+    def _queue_update(self, message):
+        """
+        Holds a message produced by `_apply_entry` until the next broadcast tick, merging it with any update to the same entry
+        that is already waiting, so a producer updating one entry in a tight loop costs one broadcast per tick rather than per update
+            a full entry is the entry itself, so whatever it is queued over, sending it at the tick sends the latest state
+            an `append` over a waiting `append` is folded into it; the merged message carries `base_version`, the version it applies on top of
+            a clear drops everything queued before it
+        """
+        if threading.current_thread() is not self.thread:
+            self.loop.call_soon_threadsafe(self._queue_update, message)
+            return
+
+        if message.get('data') == '___clear___':
+            self.pending_updates = {}
+            key = None  # never collides with an entry id
+        else:
+            key = message['id']
+            pending = self.pending_updates.get(key)
+            if pending is not None and message.get('op') == 'append':
+                if pending.get('op') == 'append':
+                    message = self._merge_appends(pending, message)
+                elif pending.get('op') != 'delete':
+                    message = pending  # the full entry already waiting includes this append
+            elif pending is not None and pending.get('op') == 'delete':
+                del self.pending_updates[key]  # recreated after being evicted; clients will add it at the end, like the server did
+        self.pending_updates[key] = message
+
+        if self._flush_handle is None:
+            delay = self._last_flush + 1 / self.update_rate - self.loop.time() if self.update_rate else 0
+            self._flush_handle = self.loop.call_later(delay, self._flush_updates) if delay > 0 else self.loop.call_soon(self._flush_updates)
+
+    def _merge_appends(self, pending, message):
+        if 'base_version' not in pending:
+            # first merge; copy so that folding in later appends doesn't modify the data the producer sent
+            pending = {**pending, 'data': copy.copy(pending['data']), 'base_version': pending['version'] - 1}
+        pending['data'] = append_data(pending['data'], message['data'])
+        pending['view'] = message['view']
+        pending['version'] = message['version']
+        if message.get('max_length') and len(pending['data']) > message['max_length']:
+            del pending['data'][:-message['max_length']]
+            pending['max_length'] = message['max_length']
+        return pending
+
+    def _flush_updates(self):
+        # broadcast everything queued by `_queue_update` as one message
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._last_flush = self.loop.time()
+        if self.blobs:
+            for id in self.pending_updates:
+                if id in self.entries:
+                    self._spill_entry(self.entries[id])
+        messages = [message for message in self.pending_updates.values() if message.get('op') == 'delete' or message['data'] == '___clear___' or self._is_current(message)]
+        self.pending_updates = {}
+        if messages:
+            self._broadcast(messages)
+
+    def _broadcast(self, updates: list):
+        # number a list of updates (that clients apply in order), keep it in `history` and queue it for every connected websocket client;
+        # each client's writer task sends it at that client's own pace. Only called on the loop thread
+        self.broadcast_seq += 1
+        journal_updates = updates
+        if self.downsample_points:
+            updates = [self._client_update(update) for update in updates]
+        message = BroadcastMessage({'seq': self.broadcast_seq, 'updates': updates})  # serialized once and shared by every client
+
+        self.history.append((self.broadcast_seq, message))
+        self.history_bytes += message.length
+        while len(self.history) > SYNC_HISTORY_SIZE or (self.history_bytes > SYNC_HISTORY_BYTES and len(self.history) > 1):
+            self.history_bytes -= self.history.popleft()[1].length
+
+        if self.journal:
+            # browsers are sent downsampled series; the journal keeps every point
+            has_series = any(isinstance(self.entries.get(update.get('id'), {}).get('data'), Series) for update in journal_updates)
+            self.journal.append(to_json_parts({'seq': self.broadcast_seq, 'updates': journal_updates}) if has_series else message.parts)
+            if self.journal.needs_compaction:
+                self.journal.compact(to_json_parts({'seq': self.broadcast_seq, 'updates': [{'op': 'snapshot', 'entries': list(self.entries.values())}]}))
+
+        if not self.websocket_clients:
+            self.undelivered_from = self.undelivered_from or self.broadcast_seq
+        for subscriber in self.websocket_clients:
+            # filtered once per distinct subscription; clients that subscribed to none of the updates are skipped entirely
+            filtered = message.for_subscription(subscriber.subscription, updates)
+            if filtered:
+                subscriber.enqueue(self.broadcast_seq, filtered)
+            else:
+                subscriber.skip(self.broadcast_seq)
+
+    def _replay_journal(self):
+        # rebuild the entries from the journal left by a previous run, applying its updates the same way browsers do
+        for message in read_journal(self.journal_path):
+            self.broadcast_seq = message['seq']  # carry on numbering from where the previous run left off
+            for update in message['updates']:
+                op = update.get('op')
+                if update.get('data') == '___clear___':
+                    self.entries = {}
+                elif op == 'snapshot':
+                    self.entries = {entry['id']: entry for entry in update['entries']}
+                elif op == 'append':
+                    entry = self.entries.get(update['id'])
+                    if entry and entry['version'] != update.get('base_version', update['version'] - 1):
+                        # a message is missing (e.g. the journal was cut short by a write error); drop the entry rather than
+                        # rebuild it wrong, as a browser would resync it; it comes back with the next full update
+                        del self.entries[update['id']]
+                    elif entry:
+                        entry['data'] = append_data(entry['data'], update['data'])
+                        entry['view'] = update['view']
+                        entry['version'] = update['version']
+                        self._trim_entry(entry)
+                elif op == 'delete':
+                    self.entries.pop(update['id'], None)
+                else:
+                    self.entries[update['id']] = update
+        self.delivered_seq = self.broadcast_seq
+
+        for id, entry in list(self.entries.items()):
+            self._series_entry(entry)
+            self._spill_entry(entry)
+            if self.memory_budget:
+                self._track_entry_size(id, self._get_entry_size(entry))
+
+    def delete(self, id: str):
+        entry = self.entries.pop(id, None)
+        if entry is not None:
+            self.memory_used -= self.entry_sizes.pop(id, 0)
+            self._queue_update(self._delete_message(id, entry))  # so other browsers, and the journal, drop it too
+
+    def _delete_message(self, id: str, entry: Optional[dict]) -> dict:
+        message = {'op': 'delete', 'id': id}
+        if entry and 'channel' in entry:
+            message['channel'] = entry['channel']  # for routing to subscribers
+        return message
+
+    def get_entries(self, subscription: Optional[Subscription] = None) -> list:
+        # every entry, or just those matching `subscription`
+        if subscription is None:
+            return list(self.entries.values())
+        return [entry for entry in self.entries.values() if subscription.matches(entry.get('channel'), entry['id'])]
+
+    def clear(self, subscription: Optional[Subscription] = None):
         # if this instance is the server, clear the entries list and send a clear request to all clients via websocket
-        self.entries = []
+        # with a subscription, only its entries are deleted; browsers watching other channels keep theirs
+        if subscription is not None:
+            for entry in self.get_entries(subscription):
+                self.delete(entry['id'])
+            return
+        self.entries = {}
+        self.entry_sizes.clear()
+        self.memory_used = 0
         self.send(value='___clear___')
     
+    async def wait_async(self):
+        # waits, from the loop thread, until everything broadcast so far has been sent to the client via websocket
+        # later broadcasts don't hold it up, so a busy producer can't keep another caller waiting
+        if self.pending_updates:
+            self._flush_updates()  # don't hold the caller up until the next tick
+        seq = self.broadcast_seq
+        if self.delivered_seq >= seq:
+            return
+        future = self.loop.create_future()
+        self.delivery_waiters.append((seq, future))
+        await future
+
+    async def _get_broadcast_seq(self):
+        if self.pending_updates:
+            self._flush_updates()
+        return self.broadcast_seq
+
     def wait(self):
-        while self.pending_entries:
-            time.sleep(0.01)
\ No newline at end of file
+        if threading.current_thread() is self.thread:
+            return  # blocking here would stop the loop from ever sending anything; use `wait_async` instead
+        # read the sequence number on the loop thread, so anything already handed to the loop (e.g. via `send_threadsafe`) is counted
+        seq = asyncio.run_coroutine_threadsafe(self._get_broadcast_seq(), self.loop).result()
+        with self.delivered_condition:
+            self.delivered_condition.wait_for(lambda: self.delivered_seq >= seq)
@@ -1,5 +1,6 @@
 from .utils_serialize import to_json_string
 import inspect
+import json
 import re
 import os
 import types
@@ -28,6 +29,23 @@ def append_data(source_data, new_data):
     return source_data
 
 
+def is_replayable_append(source_data, new_data):
+    """
+    Whether `append_data(source_data, new_data)` is a plain concatenation or update that a client holding `source_data`
+    can reproduce from `new_data` alone (list + list, str + str or dict + dict)
+    """
+    if not source_data:
+        return False
+    return any(isinstance(source_data, t) and isinstance(new_data, t) for t in (list, str, dict))
+
+
+def get_json_size(data):
+    """
+    Approximate size of `data` in bytes, measured as the length of its JSON encoding
+    """
+    return len(json.dumps(data, ensure_ascii=False, default=str))
+
+
 def get_stack_trace():
     shellviz_dir = os.path.dirname(os.path.abspath(__file__))
     cwd = os.getcwd()
@@ -0,0 +1,222 @@
+import json
+import mmap
+import tempfile
+from array import array
+from typing import Optional
+
+from .utils_serialize import to_json_safe
+from .utils_series import Series
+
+
+class _Segment:
+    # a sparse temporary file mapped into memory; pages are only backed once something is written to them
+    def __init__(self, size: int, directory: Optional[str] = None):
+        self.size = size
+        self.used = 0
+        self.file = tempfile.TemporaryFile(dir=directory)  # deleted as soon as it is closed
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+
+class _Extent:
+    # a range of a segment reserved for one value, which grows into it as it is appended to
+    __slots__ = ('segment', 'start', 'end', 'used', 'offsets')
+
+    def __init__(self, segment: _Segment, start: int, end: int):
+        self.segment = segment
+        self.start = start
+        self.end = end
+        self.used = start
+        self.offsets = None  # if item offsets are tracked for a list, where each of its items written here ends
+
+
+# what a value of each kind is wrapped in; blobs of lists and strings store only what is between the brackets or quotes, so
+# appending to them never changes bytes that were already written
+_DELIMITERS = {list: (b'[', b']'), str: (b'"', b'"')}
+_SEPARATOR = b', '  # between list items, as json.dumps writes them
+
+_encoder = json.JSONEncoder(ensure_ascii=False, default=to_json_safe)
+
+
+class Blob:
+    """
+    A serialized JSON value held in a BlobStore rather than as Python objects
+    `kind` is the type the value had (list, str, dict...); for a list, `count` is its length and `first` the index of its first
+    item among those written to the extent, so appends and trims can be handled without decoding it
+    A blob never changes once stored; appending to or trimming it returns a new blob that shares its bytes
+    """
+    __slots__ = ('extent', 'start', 'length', 'kind', 'first', 'count')
+
+    def __init__(self, extent: _Extent, start: int, length: int, kind: type, first: int = 0, count: int = 0):
+        self.extent = extent
+        self.start = start  # position of the value in the segment
+        self.length = length  # bytes stored, excluding the brackets or quotes
+        self.kind = kind
+        self.first = first
+        self.count = count
+
+    @property
+    def size(self) -> int:
+        # length of the JSON encoding
+        return self.length + (2 if self.kind in _DELIMITERS else 0)
+
+    def parts(self) -> list:
+        # the JSON encoding, as bytes-like parts read straight from the mapping
+        view = memoryview(self.extent.segment.map)[self.start:self.start + self.length]
+        if self.kind not in _DELIMITERS:
+            return [view]
+        opening, closing = _DELIMITERS[self.kind]
+        return [opening, view, closing]
+
+    def load(self):
+        return json.loads(b''.join(self.parts()))
+
+
+class BlobStore:
+    """
+    Keeps large JSON values in memory-mapped temporary files, so they live in the page cache (which the OS can write out and
+    evict under pressure) instead of the Python heap
+    Each value is given room to grow to twice its size, so a value that keeps being appended to is only copied when it doubles
+    A segment is released once every blob in it is gone
+    """
+    def __init__(self, segment_size: int = 64 * 1024 * 1024, directory: Optional[str] = None):
+        self.segment_size = segment_size
+        self.directory = directory
+        self._segment = None  # the segment new values are added to; older ones are kept alive only by their blobs
+
+    def put(self, data, min_size: int = 0, offsets: bool = False) -> Optional[Blob]:
+        """
+        Stores a list, string or dict; returns None for anything else, or if its JSON encoding is shorter than `min_size`
+        With `offsets`, where each item of a list ends is recorded so that it can be trimmed (see `trim`); this encodes the
+        items one at a time, which is slower
+        """
+        kind = type(data)
+        if kind is list and offsets:
+            items = [_encoder.encode(item).encode() for item in data]
+            size = sum(len(item) for item in items) + len(_SEPARATOR) * max(len(items) - 1, 0) + 2
+        elif kind in (list, str, dict):
+            encoded = _encoder.encode(data).encode()
+            size = len(encoded)
+        else:
+            return None
+        if size < min_size:
+            return None
+        extent = self._allocate(2 * size)
+        blob = Blob(extent, extent.start, 0, kind)
+        if kind is list and offsets:
+            extent.offsets = array('Q')
+            return self._write_items(blob, items)
+        return self._write(blob, encoded[1:-1] if kind in _DELIMITERS else encoded, len(data) if kind is list else 0)
+
+    def extend(self, blob: Blob, data) -> Blob:
+        """
+        Returns a blob of `blob`'s list or string with `data` (a list or string of the same kind) appended to it
+        """
+        extent = blob.extent
+        if extent.offsets is not None:
+            items = [_encoder.encode(item).encode() for item in data]
+            added = sum(len(item) for item in items) + len(_SEPARATOR) * len(items)
+        else:
+            encoded = _encoder.encode(data).encode()[1:-1]
+            if blob.kind is list and blob.count and encoded:
+                encoded = _SEPARATOR + encoded
+            added = len(encoded)
+        is_tail = extent.used == blob.start + blob.length and (extent.offsets is None or len(extent.offsets) == blob.first + blob.count)
+        if not (is_tail and extent.used + added <= extent.end):
+            blob = self._relocate(blob, 2 * (blob.length + added))  # no room left in place
+        if extent.offsets is not None:
+            return self._write_items(blob, items)
+        return self._write(blob, encoded, len(data) if blob.kind is list else 0)
+
+    def trim(self, blob: Blob, count: int) -> Blob:
+        """
+        Returns a blob of `blob`'s list without its first `count` items; the list must have been stored with `offsets`
+        """
+        count = min(count, blob.count)
+        if not count:
+            return blob
+        if count == blob.count:
+            return Blob(blob.extent, blob.start + blob.length, 0, list, blob.first + count, 0)
+        start = blob.extent.offsets[blob.first + count - 1] + len(_SEPARATOR)
+        return Blob(blob.extent, start, blob.length - (start - blob.start), list, blob.first + count, blob.count - count)
+
+    def _allocate(self, size: int) -> _Extent:
+        if self._segment is None or self._segment.used + size > self._segment.size:
+            self._segment = _Segment(max(self.segment_size, size), self.directory)
+        segment = self._segment
+        extent = _Extent(segment, segment.used, segment.used + size)
+        segment.used += size
+        return extent
+
+    def _relocate(self, blob: Blob, size: int) -> Blob:
+        # copies a blob to the start of a new extent of `size` bytes
+        extent = self._allocate(size)
+        old = blob.extent
+        extent.segment.map[extent.start:extent.start + blob.length] = old.segment.map[blob.start:blob.start + blob.length]
+        extent.used = extent.start + blob.length
+        if old.offsets is not None:
+            shift = blob.start - extent.start
+            extent.offsets = array('Q', [offset - shift for offset in old.offsets[blob.first:blob.first + blob.count]])
+        return Blob(extent, extent.start, blob.length, blob.kind, 0, blob.count)
+
+    def _write(self, blob: Blob, data: bytes, count: int = 0) -> Blob:
+        # writes `data` (holding `count` list items) after a blob at the tail of its extent, returning the longer blob
+        extent = blob.extent
+        extent.segment.map[extent.used:extent.used + len(data)] = data
+        extent.used += len(data)
+        return Blob(extent, blob.start, blob.length + len(data), blob.kind, blob.first, blob.count + count)
+
+    def _write_items(self, blob: Blob, items: list) -> Blob:
+        # like `_write`, for a list whose item offsets are tracked
+        if not items:
+            return blob
+        position = blob.extent.used + (len(_SEPARATOR) if blob.count else 0)
+        for item in items:
+            position += len(item)
+            blob.extent.offsets.append(position)
+            position += len(_SEPARATOR)
+        return self._write(blob, (_SEPARATOR if blob.count else b'') + _SEPARATOR.join(items), len(items))
+
+
+def estimate_json_size(data) -> int:
+    """
+    A cheap guess at the length of `data`'s JSON encoding, from its length and a sample of its items
+    """
+    if isinstance(data, (str, bytes)):
+        return len(data) + 2
+    if isinstance(data, (list, tuple, dict)) and data:
+        items = list(data.items()) if isinstance(data, dict) else data
+        sample = [items[0], items[len(items) // 2], items[-1]]
+        return len(items) * len(json.dumps(sample, ensure_ascii=False, default=str)) // 3
+    return 8
+
+
+_BLOB_MARKER = '\x00shellviz-blob\x00'
+_ENCODED_BLOB_MARKER = json.dumps(_BLOB_MARKER)
+
+
+def to_json_parts(data, downsample: bool = False) -> list:
+    """
+    Serializes `data` like `to_json_string`, but as a list of bytes-like parts with any Blobs spliced in straight from their
+    mapping, so large values are never decoded; write the parts out in order (e.g. with `writelines`)
+    Series are written in full, or with `downsample` as browsers are sent them (see `Series.downsample`)
+    """
+    blobs = []
+
+    def default(obj):
+        if isinstance(obj, Blob):
+            blobs.append(obj)
+            return _BLOB_MARKER
+        if isinstance(obj, Series):
+            return obj.downsample() if downsample else obj.values.tolist()
+        return to_json_safe(obj)
+
+    text = json.dumps(data, ensure_ascii=False, default=default)
+    if not blobs:
+        return [text.encode()]
+    pieces = text.split(_ENCODED_BLOB_MARKER)
+    parts = [pieces[0].encode()]
+    for blob, piece in zip(blobs, pieces[1:]):
+        parts.extend(blob.parts())
+        parts.append(piece.encode())
+    return parts
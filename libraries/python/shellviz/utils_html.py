@@ -1,13 +1,26 @@
+import asyncio
 from asyncio import StreamReader, StreamWriter, IncompleteReadError
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import gzip
+import hashlib
 import json
 import mimetypes
 import os
+import select
 import socket
+import threading
+import time
 from string import Template
 from typing import Optional, Union
 
 
+HTTP_KEEP_ALIVE_TIMEOUT = 5  # seconds an idle keep-alive connection is held open waiting for the next request
+HTTP_REQUEST_TIMEOUT = 60  # seconds a client that has started sending a request may stall before the connection is dropped
+HTTP_LINGER_TIMEOUT = 2  # seconds a connection is held after its last response for the client to read it and close its end (see `HttpRequestReader.discard`)
+HTTP_KEEP_ALIVE_MAX_REQUESTS = 1000  # requests served on one connection before it is closed, so no single client holds one forever
+HTTP_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')  # requests that are safe to resend if the server may already have read them
+
+
 def get_local_ip():
     """
     Returns the local IP address of the machine.
@@ -23,67 +36,170 @@ def get_local_ip():
     return IP
 
 
+def get_unix_socket_path(url: Optional[str]) -> Optional[str]:
+    """
+    Returns the socket path of a `unix://` url (e.g. `unix:///tmp/shellviz.sock`), or None for any other kind of url
+    """
+    if not url or not url.startswith('unix://'):
+        return None
+    return url[len('unix://'):]
+
+
 @dataclass
 class HttpRequest:
     method: str = ""
     path: str = ""
-    body: Optional[str] = None
-
-
-async def parse_request(reader: StreamReader) -> HttpRequest:
-    """
-    Robustly parse an HTTP request from the provided StreamReader.
-    Reads headers fully, determines Content-Length, and reads the correct body size.
-    Returns an HttpRequest instance.
-    """
-    headers_bytes = b''
-    while True:
-        chunk = await reader.readuntil(b'\n')
-        headers_bytes += chunk
-        if b'\r\n\r\n' in headers_bytes:
-            break
-        # Protect against malicious clients sending headers forever
-        if len(headers_bytes) > 32 * 1024:
-            raise ValueError('HTTP headers too large')
-    headers_str, _, rest = headers_bytes.partition(b'\r\n\r\n')
-    headers_text = headers_str.decode(errors='replace')
-    header_lines = headers_text.split('\r\n')
-    if not header_lines or len(header_lines[0].split()) < 2:
-        raise ValueError('Malformed HTTP request line')
-    request_line = header_lines[0]
-    method, path, *_ = request_line.split()
-    # Parse headers
-    headers = {}
-    for line in header_lines[1:]:
-        if not line.strip():
-            continue
-        if ':' in line:
-            k, v = line.split(':', 1)
-            headers[k.strip().lower()] = v.strip()
-    content_length = int(headers.get('content-length', '0'))
-    # The remainder after \r\n\r\n may contain part/all of the body
-    body_bytes = rest
-    to_read = content_length - len(body_bytes)
-    if to_read > 0:
-        more = await reader.readexactly(to_read)
-        body_bytes += more
-    body = body_bytes.decode(errors='replace') if content_length > 0 else None
-    return HttpRequest(method=method, path=path, body=body)
-
+    body: Optional[bytes] = None
+    version: str = "HTTP/1.1"
+    headers: dict = field(default_factory=dict)  # lowercased header names
+
+    @property
+    def keep_alive(self) -> bool:
+        """
+        Whether the client expects the connection to stay open after the response is sent
+        HTTP/1.1 connections are persistent by default; HTTP/1.0 connections only if the client explicitly asks for it
+        """
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    @property
+    def is_websocket_upgrade(self) -> bool:
+        return self.method == 'GET' and self.headers.get('upgrade', '').lower() == 'websocket'
+
+
+class HttpRequestReader:
+    """
+    Reads HTTP requests off a connection through a single buffer, which is filled in large reads and only ever scanned once
+    Bytes after a request (a pipelined request, or the first frames on a connection upgraded to a websocket) stay buffered
+    for whatever reads next; `readexactly` serves them before reading from the stream, so it can be handed to websocket code
+    If `writer` is given, clients that send `Expect: 100-continue` are told to go ahead before their body is read
+    Once a request has started, each read waits at most `request_timeout` seconds for more of it (see `read_request`)
+    """
+    def __init__(self, reader: StreamReader, writer: Optional[StreamWriter] = None, max_header_size: int = 32 * 1024, request_timeout: Optional[float] = HTTP_REQUEST_TIMEOUT):
+        self._reader = reader
+        self._writer = writer
+        self._buffer = bytearray()
+        self.max_header_size = max_header_size
+        self.request_timeout = request_timeout
+        self._timeout = None  # how long a read may wait; only set while a request is being read, never for websocket frames
+
+    async def _fill(self, timeout: Optional[float] = None) -> bool:
+        # read whatever the stream has next into the buffer; returns False at the end of the stream
+        timeout = timeout or self._timeout
+        read = self._reader.read(64 * 1024)
+        chunk = await (asyncio.wait_for(read, timeout) if timeout else read)
+        self._buffer += chunk
+        return bool(chunk)
+
+    async def _read_until(self, separator: bytes, limit: int) -> bytes:
+        # returns the bytes before the next `separator`, consuming both
+        scanned = 0
+        while True:
+            index = self._buffer.find(separator, scanned)
+            if index > limit:
+                raise ValueError('HTTP headers too large')
+            if index >= 0:
+                data = bytes(memoryview(self._buffer)[:index])
+                del self._buffer[:index + len(separator)]
+                return data
+            if len(self._buffer) > limit:
+                raise ValueError('HTTP headers too large')
+            scanned = max(len(self._buffer) - len(separator) + 1, 0)
+            if not await self._fill():
+                raise IncompleteReadError(bytes(self._buffer), None)
+
+    async def readexactly(self, n: int) -> bytes:
+        while len(self._buffer) < n:
+            if not await self._fill():
+                raise IncompleteReadError(bytes(self._buffer), n)
+        data = bytes(memoryview(self._buffer)[:n])
+        del self._buffer[:n]
+        return data
+
+    async def discard(self) -> None:
+        """
+        Reads and drops whatever the client still sends until it closes its end of the connection
+        Closing a connection while requests the client pipelined are still unread resets it, which can throw away responses the
+        client hasn't read yet (including the one saying the connection is closing); so the server waits on this before closing
+        """
+        del self._buffer[:]
+        while await self._fill():
+            del self._buffer[:]
+
+    async def read_request(self, idle_timeout: Optional[float] = None) -> Optional[HttpRequest]:
+        """
+        Reads the next request, including its body (sent with a Content-Length or chunked)
+        Returns None if the client closed the connection before starting another request
+        Waits up to `idle_timeout` seconds for the request to start, and from then on `request_timeout` for each read, so a
+        large upload can take as long as it needs as long as it keeps arriving; raises asyncio.TimeoutError on either
+        """
+        while not self._buffer:
+            if not await self._fill(idle_timeout):
+                return None
+        self._timeout = self.request_timeout
+        try:
+            return await self._read_request()
+        finally:
+            self._timeout = None
+
+    async def _read_request(self) -> HttpRequest:
+        head = await self._read_until(b'\r\n\r\n', self.max_header_size)
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        parts = request_line.split()
+        if len(parts) < 2:
+            raise ValueError('Malformed HTTP request line')
+        headers = {}
+        for line in header_lines:
+            name, separator, value = line.partition(':')
+            if separator:
+                name, value = name.strip().lower(), value.strip()
+                headers[name] = f'{headers[name]}, {value}' if name in headers else value  # repeated headers combine into a list
+        request = HttpRequest(method=parts[0], path=parts[1], version=parts[2] if len(parts) > 2 else 'HTTP/1.0', headers=headers)
+
+        chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        content_length = int(headers.get('content-length', '0')) if not chunked else 0
+        if (chunked or content_length) and self._writer and headers.get('expect', '').lower() == '100-continue':
+            self._writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        if chunked:
+            request.body = await self._read_chunked_body()
+        elif content_length > 0:
+            request.body = await self.readexactly(content_length)
+        return request
+
+    async def _read_chunked_body(self) -> bytes:
+        body = bytearray()
+        while True:
+            size_line = await self._read_until(b'\r\n', self.max_header_size)
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)  # a chunk size may be followed by extensions, which we ignore
+            if size == 0:
+                break
+            body += await self.readexactly(size)
+            await self.readexactly(2)  # the CRLF that ends the chunk
+        while await self._read_until(b'\r\n', self.max_header_size):
+            pass  # trailer headers, up to the blank line that ends the request
+        return bytes(body)
 
 
-async def write_response(writer: StreamWriter, status_code: int=200, status_message: str='OK', content_type: str=None, content: str=None) -> None:
+async def write_response(writer: StreamWriter, status_code: int=200, status_message: str='OK', content_type: str=None, content: str=None, keep_alive: bool=False, headers: Optional[dict]=None) -> None:
     """
     Takes a StreamWriter instance initiated from an `asyncio.start_server` request and returns a response with the provided status code and message.
-    Supports both string and bytes content. Always adds CORS headers.
+    Supports string and bytes content, or a list of bytes-like parts that are written out in order. Always adds CORS headers.
+    If `keep_alive` is True the connection is left open so the caller can read the next request from it; otherwise this side of it
+    is shut down, and the caller closes it once the client has read the response (see `HttpRequestReader.discard`).
+    Keep-alive responses tell the client how long the connection will be held open while idle (`HTTP_KEEP_ALIVE_TIMEOUT`).
+    Any `headers` are added to the response as they are.
     """
-    # Prepare content as bytes
+    # Prepare content as a list of bytes-like parts
     if content is None:
-        content_bytes = b""
+        content_parts = []
     elif isinstance(content, str):
-        content_bytes = content.encode("utf-8")
+        content_parts = [content.encode("utf-8")]
+    elif isinstance(content, list):
+        content_parts = content
     else:
-        content_bytes = content  # assume bytes
+        content_parts = [content]  # assume bytes
 
     response = (
         f"HTTP/1.1 {status_code} {status_message}\r\n"
@@ -93,16 +209,19 @@ async def write_response(writer: StreamWriter, status_code: int=200, status_mess
     )
     if content_type:
         response += f"Content-Type: {content_type}\r\n"
-    response += f"Content-Length: {len(content_bytes)}\r\n"
-    response += "Connection: close\r\n"
+    for name, value in (headers or {}).items():
+        response += f"{name}: {value}\r\n"
+    if status_code != 304:  # a 304 has no body; a Content-Length would describe the cached one
+        response += f"Content-Length: {sum(len(part) for part in content_parts)}\r\n"
+    response += f"Connection: keep-alive\r\nKeep-Alive: timeout={HTTP_KEEP_ALIVE_TIMEOUT}\r\n" if keep_alive else "Connection: close\r\n"
     response += "\r\n"
 
-    writer.write(response.encode("utf-8") + content_bytes)
+    writer.writelines([response.encode("utf-8"), *content_parts])
     await writer.drain()
-    writer.close()
-    await writer.wait_closed()
+    if not keep_alive and writer.can_write_eof():
+        writer.write_eof()
 
-async def write_html(writer: StreamWriter, html: str) -> None:
+async def write_html(writer: StreamWriter, html: str, keep_alive: bool = False) -> None:
     """
     Takes a StreamWriter instance initiated from an `aynscio.start_server` request and returns a response with the provided `html` content
     e.g.
@@ -112,39 +231,47 @@ async def write_html(writer: StreamWriter, html: str) -> None:
         await write_html(writer, 'hello world')
     """
 
-    await write_response(writer,content_type='text/html', content=html)
+    await write_response(writer,content_type='text/html', content=html, keep_alive=keep_alive)
 
-async def write_404(writer: StreamWriter) -> None:
+async def write_404(writer: StreamWriter, keep_alive: bool = False) -> None:
     """
     Takes a StreamWriter instance initiated from an `aynscio.start_server` request and returns a 404 response
     """
-    await write_response(writer, 404, "Not Found")
+    await write_response(writer, 404, "Not Found", keep_alive=keep_alive)
+
+async def write_400(writer: StreamWriter, message: Optional[str] = None, keep_alive: bool = False) -> None:
+    """
+    Takes a StreamWriter instance initiated from an `aynscio.start_server` request and returns a 400 response, with `message`
+    (what was wrong with the request) as its body
+    """
+    await write_response(writer, 400, "Bad Request", content_type='text/plain' if message else None, content=message, keep_alive=keep_alive)
 
-async def write_200(writer: StreamWriter) -> None:
+async def write_200(writer: StreamWriter, keep_alive: bool = False) -> None:
     """
     Takes a StreamWriter instance initiated from an `aynscio.start_server` request and returns a 200 response
     """
-    await write_response(writer)
+    await write_response(writer, keep_alive=keep_alive)
 
-async def write_json(writer: StreamWriter, json_data: str) -> None:
+async def write_json(writer: StreamWriter, json_data: Union[str, list], keep_alive: bool = False) -> None:
     """
     Takes a StreamWriter instance initiated from an `asyncio.start_server` request and returns a JSON response
     with proper content type and formatting.
     
     Args:
         writer: The StreamWriter instance
-        json_data: The JSON string to send in the response
+        json_data: The JSON string to send in the response, or a list of bytes-like parts that make it up
+        keep_alive: Whether to leave the connection open after the response is sent
     """
-    await write_response(writer, content_type='application/json', content=json_data)
+    await write_response(writer, content_type='application/json', content=json_data, keep_alive=keep_alive)
 
-async def write_cors_headers(writer: StreamWriter) -> None:
+async def write_cors_headers(writer: StreamWriter, keep_alive: bool = False) -> None:
     """
     Takes a StreamWriter instance initiated from an `aynscio.start_server` request and returns a response with the CORS headers
     This enables the client to make cross-origin requests (e.g. via the browser plugin) to the server
     """
-    await write_response(writer, 200, "OK")
+    await write_response(writer, 200, "OK", keep_alive=keep_alive)
 
-async def write_file(writer: StreamWriter, file_path: str) -> None:
+async def write_file(writer: StreamWriter, file_path: str, keep_alive: bool = False) -> None:
     """
     Takes a StreamWriter instance initiated from an `asyncio.start_server` request and returns a response with the content of the file at `file_path`.
     `file_path` is an absolute path to the file.
@@ -156,17 +283,88 @@ async def write_file(writer: StreamWriter, file_path: str) -> None:
     """
 
     if not os.path.isfile(file_path):
-        return await write_404(writer)
+        return await write_404(writer, keep_alive=keep_alive)
 
     content_type, _ = mimetypes.guess_type(file_path)
     content_type = content_type or "application/octet-stream"
     with open(file_path, "rb") as f:
         file_content = f.read()
 
-    if content_type and (content_type.startswith("text/") or content_type == "application/json"):
-        file_content = file_content.decode('utf-8')
+    await write_response(writer, content_type=content_type, content=file_content, keep_alive=keep_alive)
 
-    await write_response(writer, content_type=content_type, content=file_content)
+
+@dataclass
+class StaticAsset:
+    content: bytes
+    content_type: str
+    etag: str
+    cache_control: str
+    gzipped: Optional[bytes] = None  # the content gzip-compressed, if that makes it meaningfully smaller
+
+
+class StaticAssets:
+    """
+    An in-memory cache of the files in a directory (the built client), each read and, where it helps, gzip-compressed once, so
+    serving one is a dictionary lookup and a single write
+    Files under `static/` have content-hashed names and are cached by browsers indefinitely; everything else (e.g. index.html)
+    is revalidated with its ETag on every load, and answered with a 304 if it hasn't changed
+    Nothing is cached until `load` is called; `get` returns None for files that aren't cached
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self._assets = {}  # path relative to `root`, with forward slashes -> StaticAsset
+
+    def load(self):
+        assets = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                file_path = os.path.join(directory, filename)
+                relative_path = os.path.relpath(file_path, self.root).replace(os.sep, '/')
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+                content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+                gzipped = None
+                if _is_compressible(content_type) and len(content) >= 1024:
+                    gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+                    if len(gzipped) > len(content) * 0.9:
+                        gzipped = None
+                assets[relative_path] = StaticAsset(
+                    content=content,
+                    content_type=content_type,
+                    etag=hashlib.sha1(content).hexdigest()[:20],
+                    cache_control='public, max-age=31536000, immutable' if relative_path.startswith('static/') else 'no-cache',
+                    gzipped=gzipped,
+                )
+        self._assets = assets
+
+    def get(self, path: str) -> Optional[StaticAsset]:
+        # `path` is a request path, e.g. `/` or `/static/js/main.js`
+        path = path.split('?', 1)[0].lstrip('/') or 'index.html'
+        return self._assets.get(path)
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith('text/') or content_type in ('application/javascript', 'application/json', 'image/svg+xml')
+
+
+async def write_asset(writer: StreamWriter, asset: StaticAsset, request_headers: dict, keep_alive: bool = False) -> None:
+    """
+    Takes a StreamWriter instance initiated from an `asyncio.start_server` request and returns a response with a cached asset
+    The gzipped variant is sent to clients that accept it, and a 304 to clients whose `If-None-Match` has the current ETag
+    """
+    use_gzip = asset.gzipped is not None and 'gzip' in request_headers.get('accept-encoding', '')
+    etag = f'"{asset.etag}-gzip"' if use_gzip else f'"{asset.etag}"'  # strong ETags must differ between encodings
+    headers = {'ETag': etag, 'Cache-Control': asset.cache_control}
+    if asset.gzipped is not None:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match and (if_none_match.strip() == '*' or any(tag.strip().lstrip('W/') in (f'"{asset.etag}"', f'"{asset.etag}-gzip"') for tag in if_none_match.split(','))):
+        return await write_response(writer, 304, 'Not Modified', headers=headers, keep_alive=keep_alive)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    await write_response(writer, content_type=asset.content_type, content=asset.gzipped if use_gzip else asset.content, headers=headers, keep_alive=keep_alive)
 
 
 def print_qr(url):
@@ -189,18 +387,15 @@ def print_qr(url):
 
 
 
-def send_request(path: str, body: Optional[Union[str, dict]] = None, method: Optional[str] = 'GET', timeout: Optional[int] = 1, base_url: str = 'http://localhost:5544') -> Union[str, bool]:
+def parse_base_url(base_url: str) -> tuple:
     """
-    Sends an HTTP request to the specified base_url and returns the response
-    If a response is received, returns a decoded value of that response
-
-    :param path: The path to send the request to
-    :param body: The body of the request; if a dict is provided, it will be converted to a JSON string
-    :param method: The HTTP method to use; default to GET
-    :param timeout: Request timeout in seconds
-    :param base_url: The base URL of the server to send the request to
-    :return: The response from the server or False if the request failed
+    Splits a server url into a (scheme, host, port, host_header) tuple
+    For `unix://` urls the scheme is 'unix', the host is the socket path and the port is None
     """
+    socket_path = get_unix_socket_path(base_url)
+    if socket_path:
+        return 'unix', socket_path, None, 'localhost'
+
     # Parse the endpoint URL to extract host, port, and scheme
     from urllib.parse import urlparse
     parsed = urlparse(base_url)
@@ -215,108 +410,235 @@ def send_request(path: str, body: Optional[Union[str, dict]] = None, method: Opt
         # Use default ports based on scheme
         port = 443 if parsed.scheme == 'https' else 80
     
-    # For HTTPS requests, we need to handle SSL
-    if parsed.scheme == 'https':
-        import ssl
-        context = ssl.create_default_context()
-        sock = socket.create_connection((host, port), timeout=timeout)
-        sock = context.wrap_socket(sock, server_hostname=host)
-    else:
-        sock = socket.create_connection((host, port), timeout=timeout)
-    
     # Create proper Host header
     host_header = f'{host}:{port}' if (parsed.scheme == 'http' and port != 80) or (parsed.scheme == 'https' and port != 443) else host
+    return parsed.scheme, host, port, host_header
 
-    try:
-        headers = [
-            f'{method} {path} HTTP/1.1',
-            f'Host: {host_header}'
-        ]
-        if body:
-            if isinstance(body, dict):
-                body = json.dumps(body)
-                headers.append('Content-Type: application/json')
-            headers.append(f'Content-Length: {len(body)}')
-            request = '\r\n'.join(headers) + '\r\n\r\n' + body
-        else:
-            request = '\r\n'.join(headers) + '\r\n\r\n'
-        sock.sendall(request.encode())
-        response = sock.recv(1024)
-        return response.decode()
-    finally:
-        sock.close()
 
+def encode_request(method: str, path: str, host_header: str, body: Optional[Union[str, bytes, dict]] = None) -> bytes:
+    """
+    Builds the bytes of a keep-alive HTTP/1.1 request; a dict `body` is sent as JSON
+    """
+    headers = [
+        f'{method} {path} HTTP/1.1',
+        f'Host: {host_header}',
+        'Connection: keep-alive',
+    ]
+    if body:
+        if isinstance(body, dict):
+            body = json.dumps(body)
+            headers.append('Content-Type: application/json')
+        body_bytes = body.encode() if isinstance(body, str) else body
+        headers.append(f'Content-Length: {len(body_bytes)}')
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode() + body_bytes
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode()
+
+
+def parse_response_headers(head: bytes) -> tuple:
+    """
+    Parses the status line and headers of an HTTP response (everything before the blank line)
+    Returns a tuple of (status_code, headers) with lowercased header names
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    status_parts = lines[0].split()
+    status_code = int(status_parts[1]) if len(status_parts) > 1 else 0
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return status_code, headers
 
 
-class BufferedStreamReader:
+@dataclass
+class HttpResponse:
+    status_code: int = 0
+    headers: dict = field(default_factory=dict)
+    body: bytes = b""
+    raw: bytes = b""
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get('connection', '').lower() != 'close'
+
+    @property
+    def keep_alive_timeout(self) -> Optional[float]:
+        """
+        How many seconds the server will hold the connection open while idle, from its `Keep-Alive: timeout=<n>` header
+        """
+        for param in self.headers.get('keep-alive', '').split(','):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'timeout':
+                try:
+                    return float(value)
+                except ValueError:
+                    return None
+        return None
+
+
+class NoResponseError(ConnectionResetError):
     """
-    Wraps an asyncio.StreamReader, returning bytes from an initial buffer first, then from the stream.
+    The server closed the connection after a request was written to it, without responding; it may have read and applied it
     """
-    def __init__(self, initial_bytes, reader):
-        self._buffer = initial_bytes
-        self._reader = reader
 
-    async def read(self, n=-1):
-        if self._buffer:
-            if n == -1 or n >= len(self._buffer):
-                data, self._buffer = self._buffer, b''
-                if n == -1:
-                    rest = await self._reader.read()
-                    return data + rest
-                else:
-                    rest = await self._reader.read(n - len(data)) if n > len(data) else b''
-                    return data + rest
-            else:
-                data, self._buffer = self._buffer[:n], self._buffer[n:]
-                return data
+
+class HttpConnection:
+    """
+    A single persistent HTTP/1.1 connection to a server; used by `HttpConnectionPool` so that consecutive requests
+    can reuse the same socket instead of paying a TCP setup and teardown each time
+    """
+    def __init__(self, scheme: str, host: str, port: Optional[int], timeout: Optional[float] = None):
+        if scheme == 'unix':
+            # `host` is the path of the server's unix domain socket
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(host)
+            except OSError:
+                sock.close()
+                raise
         else:
-            return await self._reader.read(n)
-
-    async def readexactly(self, n):
-        chunks = []
-        while n > 0:
-            chunk = await self.read(n)
-            if not chunk:
-                raise IncompleteReadError(b''.join(chunks), n)
-            chunks.append(chunk)
-            n -= len(chunk)
-        return b''.join(chunks)
-
-    async def readuntil(self, separator=b'\n'):
-        # Only used for header parsing
-        line = b''
+            sock = socket.create_connection((host, port), timeout=timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # requests are small and latency sensitive; don't wait to coalesce them
+        if scheme == 'https':
+            import ssl
+            context = ssl.create_default_context()
+            sock = context.wrap_socket(sock, server_hostname=host)
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.expires_at = None  # monotonic time after which the server may have closed this connection while it sat idle
+
+    def request(self, request_bytes: bytes, timeout: Optional[float] = None) -> HttpResponse:
+        """
+        Writes a fully-formed request and reads back a single response, using its Content-Length to find where it ends
+        Raises NoResponseError if the server closed the connection before responding
+        """
+        self.sock.settimeout(timeout)
+        self.sock.sendall(request_bytes)
+
+        head = b''
         while True:
-            c = await self.read(1)
-            if not c:
-                raise IncompleteReadError(line, len(separator))
-            line += c
-            if line.endswith(separator):
+            line = self.rfile.readline()
+            if not line:
+                raise NoResponseError('Connection closed by server')
+            head += line
+            if line in (b'\r\n', b'\n'):
                 break
-        return line
 
-    def at_eof(self):
-        return not self._buffer and self._reader.at_eof()
+        status_code, headers = parse_response_headers(head.rstrip(b'\r\n'))
+        content_length = int(headers.get('content-length', '0'))
+        body = self.rfile.read(content_length) if content_length > 0 else b''
+        return HttpResponse(status_code=status_code, headers=headers, body=body, raw=head + body)
+
+    def is_stale(self) -> bool:
+        """
+        Whether the server has closed this idle connection; an idle connection has nothing to read, so anything readable
+        (usually the end of the stream) means it can't be reused
+        """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self) -> None:
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class HttpConnectionPool:
+    """
+    Thread-safe pool of persistent HTTP connections, keyed by (scheme, host, port)
+    Idle connections are kept (up to `max_idle_per_host` per server) and handed out to the next request to the same server
+    Connections idle for longer than the server's keep-alive timeout are closed instead of reused, as the server will have dropped them
+    """
+    def __init__(self, max_idle_per_host: int = 8):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}  # (scheme, host, port) -> list of idle HttpConnection instances
+        self._lock = threading.Lock()
+
+    def _acquire(self, key, timeout):
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                connection = idle.pop()
+                if (connection.expires_at is None or time.monotonic() < connection.expires_at) and not connection.is_stale():
+                    return connection, True
+                connection.close()
+        return HttpConnection(*key, timeout=timeout), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, scheme: str, host: str, port: int, request_bytes: bytes, timeout: Optional[float] = None, idempotent: bool = False) -> HttpResponse:
+        """
+        Sends a request on an idle connection to the server if there is one, or a new one
+        If a reused connection turns out to have been closed, an `idempotent` request is retried once on a new connection;
+        anything else (e.g. a POST) raises, as the server may have read and applied it before closing
+        """
+        key = (scheme, host, port)
+        connection, reused = self._acquire(key, timeout)
+        try:
+            try:
+                response = connection.request(request_bytes, timeout=timeout)
+            except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+                if not (reused and idempotent):
+                    raise
+                # the server closed this idle connection (e.g. its keep-alive timeout expired); retry once on a fresh one
+                connection.close()
+                connection = HttpConnection(scheme, host, port, timeout=timeout)
+                response = connection.request(request_bytes, timeout=timeout)
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.keep_alive:
+            if response.keep_alive_timeout:
+                connection.expires_at = time.monotonic() + response.keep_alive_timeout - 1  # leave a margin for the trip to the server
+            self._release(key, connection)
+        else:
+            connection.close()
+        return response
 
-    # Add more methods as needed (e.g., readline) for compatibility
+    def close(self) -> None:
+        """
+        Closes all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
 
-    # For compatibility with parse_request expecting a StreamReader
-    def __getattr__(self, name):
-        return getattr(self._reader, name)
 
-    async def __aiter__(self):
-        while not self.at_eof():
-            chunk = await self.read(1024)
-            if not chunk:
-                break
-            yield chunk
+_connection_pool = HttpConnectionPool()  # shared by all `send_request` calls in this process
+
+
+def send_request(path: str, body: Optional[Union[str, dict]] = None, method: Optional[str] = 'GET', timeout: Optional[int] = 1, base_url: str = 'http://localhost:5544') -> Union[str, bool]:
+    """
+    Sends an HTTP request to the specified base_url and returns the response
+    If a response is received, returns a decoded value of that response
+    Connections are kept alive and reused across calls via a shared `HttpConnectionPool`
+    A `unix://<socket path>` base_url sends the request over a unix domain socket instead of TCP
 
-    # Optionally, implement other StreamReader methods as needed
+    :param path: The path to send the request to
+    :param body: The body of the request; if a dict is provided, it will be converted to a JSON string
+    :param method: The HTTP method to use; default to GET
+    :param timeout: Request timeout in seconds
+    :param base_url: The base URL of the server to send the request to
+    :return: The response from the server or False if the request failed
+    """
+    scheme, host, port, host_header = parse_base_url(base_url)
 
-    async def close(self):
-        if hasattr(self._reader, 'close'):
-            await self._reader.close()
+    request = encode_request(method, path, host_header, body)
 
-    # For compatibility with some code
-    def feed_eof(self):
-        if hasattr(self._reader, 'feed_eof'):
-            self._reader.feed_eof()
\ No newline at end of file
+    response = _connection_pool.request(scheme, host, port, request, timeout=timeout, idempotent=method in HTTP_IDEMPOTENT_METHODS)
+    return response.raw.decode(errors='replace')
@@ -0,0 +1,156 @@
+import collections
+import json
+import os
+import threading
+from typing import Iterator
+
+
+def read_journal(path: str) -> Iterator[dict]:
+    """
+    Yields the messages in a journal file, oldest first
+    Stops at the first line that can't be parsed, which is where a crash interrupted a write
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+class Journal:
+    """
+    An append-only file of the update messages broadcast by a ShellvizServer, one JSON message per line, from which its entries
+    can be rebuilt after a restart (see `read_journal`)
+
+    Writes are write-behind: `append` only queues the already-serialized message, and a writer thread writes everything that
+    has queued up since its last run and fsyncs it once, so bursts of updates share a single fsync
+    Once `compact_bytes` have been appended since the last compaction, or the writer has fallen `max_backlog_bytes` behind,
+    `needs_compaction` is set; `compact` then replaces the whole file, and everything still queued, with a single snapshot message
+    so `append` never has to wait for the disk
+
+    A message that can't be written would leave a gap that makes every later message replay onto the wrong state, so the first
+    write error disables the journal instead: it is cut back to the last complete write, and nothing more is added to it
+    """
+    def __init__(self, path: str, compact_bytes: int = 64 * 1024 * 1024, max_backlog_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.max_backlog_bytes = max_backlog_bytes
+        self.bytes_since_compaction = os.path.getsize(path) if os.path.exists(path) else 0
+        self.failed = False  # set by the first write error, after which nothing more is written
+        self._file = open(path, 'ab', buffering=0)  # unbuffered, so a failed write can be cut back without a buffer flushing it later
+        self._queue = collections.deque()  # (is_snapshot, parts) waiting to be written
+        self._backlog_bytes = 0  # size of the messages in `_queue`
+        self._condition = threading.Condition()
+        self._writing = False  # whether the writer thread is writing a batch
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def needs_compaction(self) -> bool:
+        return not self.failed and (self.bytes_since_compaction >= self.compact_bytes or self._backlog_bytes >= self.max_backlog_bytes)
+
+    def append(self, parts: list):
+        # a message is given as a list of bytes-like parts (see `to_json_parts`), which must not change once appended
+        if self.failed:
+            return
+        size = sum(len(part) for part in parts) + 1
+        self.bytes_since_compaction += size
+        with self._condition:
+            self._queue.append((False, parts))
+            self._backlog_bytes += size
+            self._condition.notify_all()
+
+    def compact(self, snapshot_parts: list):
+        # the snapshot must describe the state after every message appended so far; it replaces them, so any still queued are dropped
+        if self.failed:
+            return
+        self.bytes_since_compaction = sum(len(part) for part in snapshot_parts) + 1
+        with self._condition:
+            self._queue.clear()
+            self._queue.append((True, snapshot_parts))
+            self._backlog_bytes = 0
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return  # closed and fully written
+                batch = list(self._queue)
+                self._queue.clear()
+                self._backlog_bytes = 0
+                self._writing = True
+
+            try:
+                if not self.failed:
+                    self._write(batch)
+            except OSError as e:
+                print(f'Shellviz: journal {self.path} disabled after a write error: {e}')
+                self.failed = True
+            finally:
+                with self._condition:
+                    self._writing = False
+                    if self.failed:
+                        self._queue.clear()
+                    self._condition.notify_all()
+
+    def _write(self, batch: list):
+        if self._file.closed:
+            return
+        appended = []  # messages written to the current file since the last snapshot in the batch
+        for is_snapshot, parts in batch:
+            if is_snapshot:
+                self._append(appended)
+                appended = []
+                # write the snapshot to a new file and swap it in, so a crash part way through leaves the old journal intact
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.writelines(parts)
+                    f.write(b'\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self._file.close()
+                self._file = open(self.path, 'ab', buffering=0)
+            else:
+                appended.extend(parts)
+                appended.append(b'\n')
+        self._append(appended)
+
+    def _append(self, parts: list):
+        # writes and fsyncs whole messages; if that fails, whatever part of them made it to the file is cut off again
+        if not parts:
+            return
+        size = os.fstat(self._file.fileno()).st_size
+        try:
+            data = memoryview(b''.join(parts))
+            while data:
+                data = data[self._file.write(data):]
+            os.fsync(self._file.fileno())
+        except OSError:
+            try:
+                os.ftruncate(self._file.fileno(), size)
+            except OSError:
+                pass
+            raise
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Blocks until every message appended before this call has been written
+        Returns False if `timeout` expired first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._writing, timeout=timeout)
+
+    def close(self, timeout: float = 5):
+        # writes out anything still queued, then closes the file
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout=timeout)
+        self._file.close()
@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+import time
+from typing import Optional
+
+from . import config
+from .utils_html import send_request
+
+
+# settings the server reads from its config; a parent may have them from Django settings, which the child process can't see
+_SERVER_SETTINGS = (
+    'SHELLVIZ_MAX_ENTRY_LENGTH', 'SHELLVIZ_MEMORY_BUDGET', 'SHELLVIZ_COMPRESSION', 'SHELLVIZ_COMPRESSION_THRESHOLD',
+    'SHELLVIZ_COMPRESSION_CONTEXT_TAKEOVER', 'SHELLVIZ_UPDATE_RATE', 'SHELLVIZ_JOURNAL', 'SHELLVIZ_SPILL_THRESHOLD',
+    'SHELLVIZ_DOWNSAMPLE_POINTS',
+)
+
+
+def start_server_process(port: int, base_url: str, socket_path: Optional[str] = None, timeout: float = 10) -> subprocess.Popen:
+    """
+    Runs a ShellvizServer in a child process of its own, so it neither competes with this one for the GIL nor slows it down
+    with serialization, and returns once it answers at `base_url`
+    The child serves until its stdin is closed, which `stop_server_process` does; it also exits if this process dies
+    """
+    env = dict(os.environ)
+    # make sure the child imports this copy of the package, wherever it was loaded from
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    for key in _SERVER_SETTINGS:
+        value = getattr(config, key)
+        if value is not None:
+            env[key] = str(value)
+
+    command = [sys.executable, '-c', 'from shellviz.utils_process import run_server_process; run_server_process()', str(port)]
+    if socket_path:
+        command.append(socket_path)
+    # a session of its own keeps Ctrl+C in a terminal from stopping the server before this process has sent everything to it
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, env=env, start_new_session=True)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            send_request('/api/running', base_url=base_url)
+            return process
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+        if process.poll() is not None or time.monotonic() > deadline:
+            stop_server_process(process)
+            raise Exception(f'Server process failed to start within {timeout} seconds')
+        time.sleep(0.05)
+
+
+def stop_server_process(process: subprocess.Popen, timeout: float = 5):
+    """
+    Asks a server started by `start_server_process` to shut down, and kills it if it hasn't within `timeout` seconds
+    """
+    if process.poll() is not None:
+        return
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_server_process():
+    # the child's side of `start_server_process`: serves on the port (and socket) given as arguments until stdin is closed
+    from .server import ShellvizServer
+
+    port = int(sys.argv[1])
+    socket_path = sys.argv[2] if len(sys.argv) > 2 else None
+    server = ShellvizServer(port=port, socket_path=socket_path)
+    try:
+        sys.stdin.buffer.read()  # returns at EOF: the parent closed our stdin, or exited
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
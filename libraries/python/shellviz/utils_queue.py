@@ -0,0 +1,100 @@
+import atexit
+import collections
+import threading
+from typing import Callable, Optional
+
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class BackgroundSendQueue:
+    """
+    A bounded queue drained by a background flusher thread
+    Producers only pay the cost of a `put`; the flusher hands everything that has accumulated since its last run
+    to `flush_fn` as a single batch, so bursts of entries are coalesced into one request
+
+    `overflow` controls what happens when the queue is full:
+        block: `put` waits until the flusher makes room
+        drop_oldest: the oldest queued entry is discarded to make room for the new one
+        drop_newest: the new entry is discarded
+    """
+    def __init__(self, flush_fn: Callable[[list], None], maxsize: int = 10000, overflow: str = 'block', max_batch_size: int = 1000):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow}; expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.flush_fn = flush_fn
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.max_batch_size = max_batch_size
+        self.dropped = 0  # number of entries discarded by the overflow policy
+
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._in_flight = False  # whether the flusher is currently sending a batch
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)  # deliver anything still queued when the program exits
+
+    def put(self, item) -> None:
+        with self._condition:
+            closed = self._closed
+            if not closed:
+                self._enqueue(item)
+        if closed:
+            # the flusher has stopped (e.g. during interpreter shutdown); fall back to sending synchronously
+            self.flush_fn([item])
+
+    def _enqueue(self, item) -> None:
+        if len(self._queue) >= self.maxsize:
+            if self.overflow == 'block':
+                while len(self._queue) >= self.maxsize and not self._closed:
+                    self._condition.wait()
+            elif self.overflow == 'drop_oldest':
+                self._queue.popleft()
+                self.dropped += 1
+            else:  # drop_newest
+                self.dropped += 1
+                return
+        self._queue.append(item)
+        self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until every entry queued before this call has been handed to `flush_fn`
+        Returns False if `timeout` expired first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._in_flight, timeout=timeout)
+
+    def close(self, timeout: Optional[float] = 5) -> None:
+        """
+        Delivers any remaining entries and stops the flusher thread
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return  # closed and fully drained
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+                self._in_flight = True
+                self._condition.notify_all()  # wake any producers blocked on a full queue
+
+            try:
+                self.flush_fn(batch)
+            except (ConnectionRefusedError, ConnectionResetError, TimeoutError, OSError):
+                pass  # server unavailable; the batch is lost, the same as a failed synchronous send
+            except Exception as e:
+                print(f"Shellviz: error sending queued entries: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight = False
+                    self._condition.notify_all()
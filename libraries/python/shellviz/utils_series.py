@@ -0,0 +1,166 @@
+from array import array
+from typing import Optional
+
+
+def _typecode(values) -> Optional[str]:
+    # the array type that can hold `values` without changing them: 'q' for ints, 'd' if there are floats; None for anything else
+    typecode = 'q'
+    for value in values:
+        value_type = type(value)  # not isinstance; bools are ints, but a list of them isn't a numeric series
+        if value_type is float:
+            typecode = 'd'
+        elif value_type is not int:
+            return None
+    return typecode
+
+
+class Series:
+    """
+    A list of numbers (e.g. an area chart's values) held in an array rather than as Python objects, with a running summary of
+    its minimum and maximum over fixed-size buckets, so that it can be sent to browsers as at most `budget` points however
+    long it grows (see `downsample`)
+    Buckets are aligned to absolute positions (counting points trimmed from the front), and are doubled in size whenever there
+    are more than `budget / 2` of them; appending and trimming only ever recompute the buckets at the ends
+    """
+    def __init__(self, values: array, budget: int):
+        self.values = values
+        self.budget = budget
+        self.start = 0  # absolute position of `values[0]`
+        self.bucket_size = 1
+        self.first_bucket = 0  # absolute bucket number of the first summarized bucket
+        self.minima = array('q')  # for each bucket, the absolute position of its smallest value
+        self.maxima = array('q')  # ... and of its largest
+        self._summarize(0, bucket_size=self._fitting_bucket_size())
+
+    @classmethod
+    def create(cls, values: list, budget: int) -> Optional['Series']:
+        # returns None unless `values` is a list of ints and floats that fits in an array
+        typecode = _typecode(values)
+        if typecode is None or not values:
+            return None
+        try:
+            return cls(array(typecode, values), budget)
+        except OverflowError:  # an int too large for 64 bits
+            return None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def size(self) -> int:
+        # approximate size in bytes
+        return len(self.values) * self.values.itemsize
+
+    def can_extend(self, values) -> bool:
+        # a list of numbers, or a single number
+        return _typecode(values if isinstance(values, list) else [values]) is not None
+
+    def extend(self, values):
+        if not isinstance(values, list):
+            values = [values]
+        if self.values.typecode == 'q' and _typecode(values) == 'd':
+            self.values = array('d', self.values)
+        try:
+            self.values.extend(values)
+        except OverflowError:
+            self.values = array('d', self.values)
+            self.values.extend(values)
+        self._summarize(self.start + len(self.values) - len(values))
+
+    def trim(self, count: int):
+        # drops the first `count` values
+        del self.values[:count]
+        self.start += count
+        dropped_buckets = min(self.start // self.bucket_size - self.first_bucket, len(self.minima))
+        del self.minima[:dropped_buckets]
+        del self.maxima[:dropped_buckets]
+        self.first_bucket += dropped_buckets
+        if self.minima and self.start % self.bucket_size:
+            self._summarize(self.start, until=(self.first_bucket + 1) * self.bucket_size)  # the first bucket lost some values
+        if self.bucket_size > 1 and len(self.minima) < self.budget // 8:
+            self._summarize(self.start, bucket_size=self._fitting_bucket_size())  # much shorter than it was; summarize it at a finer resolution
+
+    def downsample(self, start: int = 0, end: Optional[int] = None, points: Optional[int] = None) -> list:
+        """
+        The values from `start` to `end` (positions in the current values) as at most `points` (default `budget`) values
+        All of them, as a plain list, if the whole series fits; otherwise `[position, value]` pairs: the smallest and largest
+        value of each of `points / 2` equal slices of the range, which keeps every spike and dip visible
+        """
+        points = max(points or self.budget, 2)
+        end = len(self.values) if end is None else min(max(end, 0), len(self.values))
+        start = min(max(start, 0), end)
+        if start == 0 and end == len(self.values) and end <= points:
+            return self.values.tolist()
+        if end - start <= points:
+            return [[position, self.values[position]] for position in range(start, end)]
+        if start == 0 and end == len(self.values) and points >= self.budget:
+            positions = self._summary_positions()
+        else:
+            bucket_size = -(-(end - start) // (points // 2))
+            positions = []
+            for bucket_start in range(start, end, bucket_size):
+                positions.extend(self._extremes(bucket_start, min(bucket_start + bucket_size, end)))
+        return [[position, self.values[position]] for position in positions]
+
+    def _summary_positions(self) -> list:
+        # the summarized minima and maxima, as positions in `values`, in order
+        positions = []
+        for minimum, maximum in zip(self.minima, self.maxima):
+            first, second = sorted((minimum - self.start, maximum - self.start))
+            positions.append(first)
+            if second != first:
+                positions.append(second)
+        return positions
+
+    def _extremes(self, start: int, end: int) -> tuple:
+        # positions of the smallest and largest of `values[start:end]`
+        chunk = self.values[start:end]
+        return start + chunk.index(min(chunk)), start + chunk.index(max(chunk))
+
+    def _fitting_bucket_size(self) -> int:
+        # the smallest power of two that splits the values into at most `budget / 2` buckets, so they are summarized in one pass
+        # rather than one bucket per value and then coarsened over and over
+        bucket_size = 1
+        while -(-len(self.values) // bucket_size) > max(self.budget // 2, 1):
+            bucket_size *= 2
+        return bucket_size
+
+    def _summarize(self, since: int, until: Optional[int] = None, bucket_size: Optional[int] = None):
+        # recomputes the buckets holding absolute positions `since` to `until` (default: the end), coarsening as needed
+        if bucket_size:
+            self.bucket_size = bucket_size
+            self.first_bucket = self.start // bucket_size
+            del self.minima[:]
+            del self.maxima[:]
+        end = self.start + len(self.values)
+        first = since // self.bucket_size
+        last = -(-min(end, until or end) // self.bucket_size)  # exclusive
+        for bucket in range(first, last):
+            lo = max(bucket * self.bucket_size, self.start)
+            hi = min((bucket + 1) * self.bucket_size, end)
+            minimum, maximum = self._extremes(lo - self.start, hi - self.start)
+            index = bucket - self.first_bucket
+            if index < len(self.minima):
+                self.minima[index], self.maxima[index] = minimum + self.start, maximum + self.start
+            else:
+                self.minima.append(minimum + self.start)
+                self.maxima.append(maximum + self.start)
+        while len(self.minima) > max(self.budget // 2, 1):
+            self._coarsen()
+
+    def _coarsen(self):
+        # doubles the bucket size, merging each pair of buckets
+        value = lambda position: self.values[position - self.start]
+        minima, maxima = array('q'), array('q')
+        for bucket, minimum, maximum in zip(range(self.first_bucket, self.first_bucket + len(self.minima)), self.minima, self.maxima):
+            if bucket % 2 and minima:
+                if value(minimum) < value(minima[-1]):
+                    minima[-1] = minimum
+                if value(maximum) > value(maxima[-1]):
+                    maxima[-1] = maximum
+            else:
+                minima.append(minimum)
+                maxima.append(maximum)
+        self.minima, self.maxima = minima, maxima
+        self.bucket_size *= 2
+        self.first_bucket //= 2
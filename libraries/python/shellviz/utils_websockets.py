@@ -1,25 +1,159 @@
+import base64
+import json
+import os
+import select
+import socket
 import struct
+import threading
+import zlib
+from typing import Optional
 
 import asyncio
 
-async def send_websocket_message(writer, message):
+from .utils_html import parse_base_url
+
+
+def apply_websocket_mask(data: bytes, masking_key: bytes) -> bytes:
+    """
+    XORs `data` with the repeating 4-byte `masking_key`; masking and unmasking are the same operation
+    Works on the whole payload as one big integer rather than byte by byte
+    """
+    length = len(data)
+    if not length:
+        return b''
+    key = (masking_key * (length // 4 + 1))[:length]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+WEBSOCKET_STREAM_CHUNK_SIZE = 64 * 1024  # bytes of payload masked at a time when streaming a message (a multiple of 4, so the mask stays aligned)
+
+
+def encode_websocket_frame_header(length: int, opcode: int = 0x1, mask: bool = False, compressed: bool = False, fin: bool = True) -> bytes:
+    """
+    Builds the header of a websocket frame with a `length` byte payload (not including the masking key); see `encode_websocket_frame`
+    A message split over several frames has `fin` set only on the last, and the opcode (and `compressed`) only on the first;
+    the rest are continuation frames (opcode 0)
+    """
+    mask_bit = 0x80 if mask else 0
+    first_byte = (0x80 if fin else 0) | (0x40 if compressed else 0) | opcode  # FIN, RSV1 (set on compressed messages) and the opcode
+    if length <= 125:
+        return struct.pack("!BB", first_byte, mask_bit | length)
+    elif length <= 65535:
+        return struct.pack("!BBH", first_byte, mask_bit | 126, length)
+    return struct.pack("!BBQ", first_byte, mask_bit | 127, length)
+
+
+def encode_websocket_frame(payload: bytes, opcode: int = 0x1, mask: bool = False, compressed: bool = False) -> bytes:
+    """
+    Builds a single, final websocket frame; frames sent by clients must be masked (`mask=True`), frames sent by servers must not
+    `compressed` marks the payload as having been compressed with `PerMessageDeflate.compress`
+    """
+    header = encode_websocket_frame_header(len(payload), opcode=opcode, mask=mask, compressed=compressed)
+    if mask:
+        masking_key = os.urandom(4)
+        return header + masking_key + apply_websocket_mask(payload, masking_key)
+    return header + payload
+
+
+def iter_websocket_frames(payload, opcode: int = 0x1, mask: bool = False, compressed: bool = False, fragment_size: Optional[int] = None):
+    """
+    Yields a message as websocket frames, piece by piece, so that a large payload is never copied into one big frame
+    `payload` is bytes or a list of bytes-like parts that make up the message; with `fragment_size` it is split over frames
+    of at most that many bytes. Unmasked, the pieces are the header and views of the payload itself; masked, the payload is
+    masked WEBSOCKET_STREAM_CHUNK_SIZE bytes at a time
+    """
+    parts = [memoryview(part) for part in (payload if isinstance(payload, list) else [payload]) if len(part)]
+    length = sum(len(part) for part in parts)
+    fragment_size = fragment_size or length or 1
+    part_index, part_offset = 0, 0
+    for frame_start in range(0, max(length, 1), fragment_size):
+        frame_length = min(fragment_size, length - frame_start)
+        first = frame_start == 0
+        header = encode_websocket_frame_header(frame_length, opcode=opcode if first else 0x0, mask=mask, compressed=compressed and first, fin=frame_start + frame_length >= length)
+        masking_key = os.urandom(4) if mask else None
+        yield header + masking_key if mask else header
+
+        position = 0  # within this frame
+        while position < frame_length:
+            # the next piece of the payload: up to the end of the current part, the frame, or (if masking) the chunk size
+            part = parts[part_index]
+            size = min(len(part) - part_offset, frame_length - position)
+            if mask:
+                size = min(size, WEBSOCKET_STREAM_CHUNK_SIZE)
+            piece = part[part_offset:part_offset + size]
+            if mask:
+                phase = position % 4  # realign the key with where this piece starts in the frame
+                piece = apply_websocket_mask(piece, masking_key[phase:] + masking_key[:phase])
+            yield piece
+            position += size
+            part_offset += size
+            if part_offset == len(part):
+                part_index, part_offset = part_index + 1, 0
+
+
+class PerMessageDeflate:
+    """
+    The permessage-deflate websocket extension (RFC 7692), as negotiated for one connection
+    With context takeover the compressor keeps its window between messages, so structure repeated across updates (e.g. the same
+    table columns) compresses to almost nothing, at the cost of a compressor per connection; without it each message is
+    compressed on its own, so the same compressed frame can be sent to every connection (see `is_shareable`)
+    """
+    def __init__(self, context_takeover: bool = False, window_bits: int = 15):
+        self.context_takeover = context_takeover
+        self.window_bits = window_bits
+        self._compressor = zlib.compressobj(wbits=-window_bits) if context_takeover else None
+        self._decompressor = zlib.decompressobj(wbits=-15)  # incoming messages may use the peer's context, so this is always kept
+
+    @property
+    def is_shareable(self) -> bool:
+        # whether `compress` gives the same output for a payload on every connection that shares this configuration
+        return not self.context_takeover and self.window_bits == 15
+
+    def compress(self, payload) -> bytes:
+        """
+        Compresses a message given as bytes, or as a list of bytes-like parts that together make up the message
+        """
+        compressor = self._compressor or zlib.compressobj(wbits=-self.window_bits)
+        data = b''.join([compressor.compress(part) for part in (payload if isinstance(payload, list) else [payload])])
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4]  # the extension drops the 00 00 ff ff tail of the sync flush
+
+    def decompress(self, payload: bytes) -> bytes:
+        return self._decompressor.decompress(payload + b'\x00\x00\xff\xff')
+
+    @classmethod
+    def negotiate(cls, offer_header: str, context_takeover: bool = False) -> tuple:
+        """
+        Picks the first permessage-deflate offer in a `Sec-WebSocket-Extensions` request header that we can honour
+        Returns a (PerMessageDeflate, response header value) pair, or (None, None) if there is none
+        """
+        for offer in offer_header.split(','):
+            name, *params = [part.strip() for part in offer.split(';')]
+            if name != 'permessage-deflate':
+                continue
+            params = dict((param.split('=', 1) + [''])[:2] for param in params if param)
+            window_bits = params.get('server_max_window_bits', '').strip('"') or '15'
+            if not window_bits.isdigit() or not 9 <= int(window_bits) <= 15:
+                continue  # zlib can't produce raw deflate streams with an 8 bit window
+            server_context_takeover = context_takeover and 'server_no_context_takeover' not in params
+
+            response = 'permessage-deflate'
+            if not server_context_takeover:
+                response += '; server_no_context_takeover'
+            if 'server_max_window_bits' in params:
+                response += f'; server_max_window_bits={window_bits}'
+            return cls(context_takeover=server_context_takeover, window_bits=int(window_bits)), response
+        return None, None
+
+
+async def send_websocket_message(writer, message, fragment_size: Optional[int] = None):
     """
     Takes a StreamWriter instance initiated from an `aynscio.start_server` request and sends a WebSocket message with the provided `message` content
+    `message` is a str, bytes, or a list of bytes-like parts that are written out without being joined; see `iter_websocket_frames`
     Silently ignores errors due to disconnects.
     """
     try:
-        message_bytes = message.encode()
-        length = len(message_bytes)
-
-        # Build the WebSocket frame header
-        if length <= 125:
-            header = struct.pack("B", 0x81) + struct.pack("B", length)
-        elif length <= 65535:
-            header = struct.pack("B", 0x81) + struct.pack("!BH", 126, length)
-        else:
-            header = struct.pack("B", 0x81) + struct.pack("!BQ", 127, length)
-
-        writer.write(header + message_bytes)
+        writer.writelines(list(iter_websocket_frames(message.encode() if isinstance(message, str) else message, fragment_size=fragment_size)))
         await writer.drain()
     except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError, asyncio.IncompleteReadError, GeneratorExit):
         # Silently ignore disconnects and cancellations
@@ -30,82 +164,70 @@ async def send_websocket_message(writer, message):
 
 
 
-async def receive_websocket_message(reader, timeout=30):
+async def _read_websocket_frame(reader) -> tuple:
+    # reads one frame; returns (fin, compressed, opcode, unmasked payload)
+    first_byte, second_byte = await reader.readexactly(2)
+    length = second_byte & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    masking_key = await reader.readexactly(4) if second_byte & 0x80 else None
+    payload = await reader.readexactly(length) if length else b''
+    if masking_key:
+        payload = apply_websocket_mask(payload, masking_key)
+    return bool(first_byte & 0x80), bool(first_byte & 0x40), first_byte & 0x0F, payload
+
+
+async def receive_websocket_message(reader, timeout=30, deflate: Optional[PerMessageDeflate] = None, writer=None):
     """
     Receives a websocket message from the reader, with a timeout and robust disconnect handling.
-    Returns None on disconnect or timeout.
+    Messages split over several frames are reassembled; `timeout` applies to each frame
+    Control frames are handled here: with a `writer`, pings are answered with a pong and a close is echoed back
+    `deflate` decompresses messages if permessage-deflate was negotiated for the connection
+    Returns the message as a str; an empty string after a control frame that arrived between messages, so that callers
+    looping over messages get a chance to check in; None on close, disconnect, timeout or a protocol error.
     """
     try:
-        # Read the frame header
-        data = await asyncio.wait_for(reader.readexactly(2), timeout=timeout)
-        if not data:
-            return None
-
-        first_byte, second_byte = data
-        fin = first_byte & 0b10000000
-        opcode = first_byte & 0b00001111
-
-        # Handle different frame types
-        if opcode == 0x8:  # Close frame
-            return None # [WebSocket] Received close frame"
-        elif opcode == 0x9:  # Ping frame
-            # Read and discard ping payload
-            is_masked = second_byte & 0b10000000
-            payload_length = second_byte & 0b01111111
-            if payload_length == 126:
-                length_data = await asyncio.wait_for(reader.readexactly(2), timeout=timeout)
-                payload_length = struct.unpack("!H", length_data)[0]
-            elif payload_length == 127:
-                length_data = await asyncio.wait_for(reader.readexactly(8), timeout=timeout)
-                payload_length = struct.unpack("!Q", length_data)[0]
-            if is_masked:
-                await asyncio.wait_for(reader.readexactly(4), timeout=timeout)  # masking key
-            if payload_length > 0:
-                await asyncio.wait_for(reader.readexactly(payload_length), timeout=timeout)  # payload
-            return ""  # Return empty string to continue loop
-        elif opcode == 0xA:  # Pong frame
-            # Read and discard pong payload
-            is_masked = second_byte & 0b10000000
-            payload_length = second_byte & 0b01111111
-            if payload_length == 126:
-                length_data = await asyncio.wait_for(reader.readexactly(2), timeout=timeout)
-                payload_length = struct.unpack("!H", length_data)[0]
-            elif payload_length == 127:
-                length_data = await asyncio.wait_for(reader.readexactly(8), timeout=timeout)
-                payload_length = struct.unpack("!Q", length_data)[0]
-            if is_masked:
-                await asyncio.wait_for(reader.readexactly(4), timeout=timeout)  # masking key
-            if payload_length > 0:
-                await asyncio.wait_for(reader.readexactly(payload_length), timeout=timeout)  # payload
-            return ""  # Return empty string to continue loop
-        elif opcode not in [0x1, 0x2]:  # Not text (0x1) or binary (0x2) frame
+        fragments = []
+        opcode, compressed = None, False  # of the message being reassembled
+        while True:
+            if timeout is None:
+                fin, frame_compressed, frame_opcode, payload = await _read_websocket_frame(reader)
+            else:
+                fin, frame_compressed, frame_opcode, payload = await asyncio.wait_for(_read_websocket_frame(reader), timeout=timeout)
+
+            if frame_opcode == 0x8:  # Close frame
+                if writer:
+                    writer.write(encode_websocket_frame(payload[:2], opcode=0x8))  # echo the status code back
+                return None
+            elif frame_opcode == 0x9:  # Ping frame
+                if writer:
+                    writer.write(encode_websocket_frame(payload, opcode=0xA))
+            elif frame_opcode == 0xA:  # Pong frame
+                pass
+            elif frame_opcode == 0x0:  # Continuation of a fragmented message
+                if opcode is None:
+                    return None  # nothing to continue
+                fragments.append(payload)
+            elif opcode is not None:
+                return None  # a new message started before the last one was finished
+            else:
+                opcode, compressed = frame_opcode, frame_compressed
+                fragments.append(payload)
+
+            if opcode is None:
+                return ""  # a control frame on its own
+            if fin and frame_opcode < 0x8:
+                break  # control frames may come between the fragments of a message, so only a data frame can end it
+
+        if opcode not in [0x1, 0x2]:  # Not text (0x1) or binary (0x2) frame
             return "" # [WebSocket] Received unsupported frame type"
+        payload_data = b''.join(fragments)
+        if compressed and deflate:
+            payload_data = deflate.decompress(payload_data)
+        return payload_data.decode('utf-8')
 
-        # Masking and payload length
-        is_masked = second_byte & 0b10000000
-        payload_length = second_byte & 0b01111111
-
-        if payload_length == 126:
-            length_data = await asyncio.wait_for(reader.readexactly(2), timeout=timeout)
-            payload_length = struct.unpack("!H", length_data)[0]
-        elif payload_length == 127:
-            length_data = await asyncio.wait_for(reader.readexactly(8), timeout=timeout)
-            payload_length = struct.unpack("!Q", length_data)[0]
-
-        # Read masking key if present
-        masking_key = None
-        if is_masked:
-            masking_key = await asyncio.wait_for(reader.readexactly(4), timeout=timeout)
-
-        # Read the payload
-        if payload_length > 0:
-            payload_data = await asyncio.wait_for(reader.readexactly(payload_length), timeout=timeout)
-            if is_masked and masking_key:
-                payload_data = bytes(b ^ masking_key[i % 4] for i, b in enumerate(payload_data))
-            return payload_data.decode('utf-8')
-        else:
-            return ""
-            
     except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError, asyncio.CancelledError, GeneratorExit):
         # Silently ignore disconnects/timeouts
         return None
@@ -116,47 +238,20 @@ async def receive_websocket_message(reader, timeout=30):
 
 
 
-async def perform_websocket_handshake(reader, writer):
-    
-    # Check if this is a BufferedStreamReader (it should be, from handle_connection)
-    if hasattr(reader, '_buffer'):
-        # For BufferedStreamReader, we need to read all available data
-        headers_bytes = reader._buffer
-        # Check if we already have the complete headers
-        if b'\r\n\r\n' not in headers_bytes:
-            # Read additional data if needed
-            while b'\r\n\r\n' not in headers_bytes:
-                chunk = await reader.read(1024)
-                if not chunk:
-                    break
-                headers_bytes += chunk
-                if len(headers_bytes) > 32 * 1024:
-                    raise ValueError('WebSocket handshake headers too large')
-        # Clear the buffer since we've consumed the handshake data
-        reader._buffer = b''
-    else:
-        # For regular StreamReader
-        headers_bytes = b''
-        while b'\r\n\r\n' not in headers_bytes:
-            chunk = await reader.read(1024)
-            if not chunk:
-                break
-            headers_bytes += chunk
-            if len(headers_bytes) > 32 * 1024:
-                raise ValueError('WebSocket handshake headers too large')
-    
-    headers_text = headers_bytes.decode(errors='replace')
-    headers = headers_text.split("\r\n")
-
-
-    # Extract the Sec-WebSocket-Key header
-    for header in headers:
-        if header.startswith("Sec-WebSocket-Key: "):
-            websocket_key = header.split(": ")[1].strip()
-            break
-    else:
+async def perform_websocket_handshake(request, writer, compression: bool = False, context_takeover: bool = False) -> Optional[PerMessageDeflate]:
+    """
+    Completes the websocket opening handshake for an upgrade request (an `HttpRequest`, as read by `HttpRequestReader`)
+    If `compression` is set and the client offers permessage-deflate, the extension is accepted and a PerMessageDeflate for the
+    connection is returned; otherwise returns None
+    """
+    websocket_key = request.headers.get('sec-websocket-key')
+    if not websocket_key:
         raise ValueError("No Sec-WebSocket-Key header in handshake request")
 
+    deflate, extensions = None, None
+    if compression:
+        deflate, extensions = PerMessageDeflate.negotiate(request.headers.get('sec-websocket-extensions', ''), context_takeover=context_takeover)
+
     # Generate the response key (the magic string is a WebSocket protocol requirement)
     accept_key = generate_websocket_accept_key(websocket_key)
 
@@ -164,10 +259,13 @@ async def perform_websocket_handshake(reader, writer):
         f"HTTP/1.1 101 Switching Protocols\r\n"
         f"Upgrade: websocket\r\n"
         f"Connection: Upgrade\r\n"
-        f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
+        f"Sec-WebSocket-Accept: {accept_key}\r\n"
+        + (f"Sec-WebSocket-Extensions: {extensions}\r\n" if extensions else "")
+        + "\r\n"
     )
     writer.write(response.encode())
     await writer.drain()
+    return deflate
 
 
 def generate_websocket_accept_key(key):
@@ -177,3 +275,158 @@ def generate_websocket_accept_key(key):
     magic_string = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
     accept_key = base64.b64encode(hashlib.sha1((key + magic_string).encode()).digest()).decode()
     return accept_key
+
+
+class WebSocketClient:
+    """
+    A minimal blocking websocket client, used by producers to stream entries to a Shellviz server over one long-lived connection
+    Thread-safe; reconnects transparently if the server closed the connection since the last message
+    """
+    def __init__(self, base_url: str, path: str = '/api/producer', timeout: float = 10, fragment_size: Optional[int] = None):
+        self.base_url = base_url
+        self.path = path
+        self.timeout = timeout
+        self.fragment_size = fragment_size  # if set, messages are split into frames of at most this many bytes
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+        self._last_ack_id = 0
+
+    def _connect(self):
+        scheme, host, port, host_header = parse_base_url(self.base_url)
+        if scheme == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(host)
+        else:
+            sock = socket.create_connection((host, port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if scheme == 'https':
+                import ssl
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock.sendall((
+            f"GET {self.path} HTTP/1.1\r\n"
+            f"Host: {host_header}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+
+        rfile = sock.makefile('rb')
+        status_line = rfile.readline()
+        while rfile.readline() not in (b'\r\n', b'\n', b''):
+            pass  # skip the rest of the handshake response headers
+        if b' 101 ' not in status_line:
+            sock.close()
+            raise ConnectionError(f'WebSocket handshake failed: {status_line.decode(errors="replace").strip()}')
+        self._sock, self._rfile = sock, rfile
+
+    def _close_socket(self):
+        if self._sock:
+            try:
+                self._rfile.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._rfile = None
+
+    def _is_stale(self) -> bool:
+        # the server only writes to this connection when answering a `wait`, so anything readable now means it is closing
+        return bool(select.select([self._sock], [], [], 0)[0])
+
+    def _send_message(self, payload: bytes, opcode: int = 0x1):
+        if self._sock and self._is_stale():
+            self._close_socket()
+        if not self._sock:
+            self._connect()
+        try:
+            self._write_frames(payload, opcode)
+        except OSError:
+            # the connection died underneath us; reconnect and retry once
+            self._close_socket()
+            self._connect()
+            self._write_frames(payload, opcode)
+
+    def _write_frames(self, payload: bytes, opcode: int):
+        # streams the message out in pieces of about WEBSOCKET_STREAM_CHUNK_SIZE, so a small message is still a single write
+        pending, pending_size = [], 0
+        for piece in iter_websocket_frames(payload, opcode=opcode, mask=True, fragment_size=self.fragment_size):
+            pending.append(piece)
+            pending_size += len(piece)
+            if pending_size >= WEBSOCKET_STREAM_CHUNK_SIZE:
+                self._sock.sendall(b''.join(pending))
+                pending, pending_size = [], 0
+        if pending:
+            self._sock.sendall(b''.join(pending))
+
+    def _receive_message(self) -> tuple:
+        """
+        Reads the next message, answering any pings that arrive first; returns (opcode, payload)
+        Fragmented messages are reassembled
+        """
+        opcode, fragments = None, []
+        while True:
+            first_byte, second_byte = self._rfile.read(2)
+            length = second_byte & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._rfile.read(8))[0]
+            frame_opcode, payload = first_byte & 0x0F, self._rfile.read(length)
+            if frame_opcode == 0x9:
+                self._sock.sendall(encode_websocket_frame(payload, opcode=0xA, mask=True))
+                continue
+            elif frame_opcode == 0xA:
+                continue
+            elif frame_opcode == 0x8:
+                return frame_opcode, payload
+            if frame_opcode:
+                opcode = frame_opcode
+            fragments.append(payload)
+            if first_byte & 0x80:
+                return opcode, b''.join(fragments)
+
+    def send(self, message: str):
+        with self._lock:
+            self._send_message(message.encode())
+
+    def wait(self, timeout: float = 60 * 10):
+        """
+        Asks the server to acknowledge once everything sent so far has been delivered to its websocket clients, and blocks until it does
+        """
+        with self._lock:
+            self._last_ack_id += 1
+            ack_id = self._last_ack_id
+            self._send_message(json.dumps({'op': 'wait', 'id': ack_id}).encode())
+            self._sock.settimeout(timeout)
+            try:
+                while True:
+                    opcode, payload = self._receive_message()
+                    if opcode == 0x8:
+                        raise ConnectionResetError('Server closed the websocket before acknowledging')
+                    if opcode == 0x1 and json.loads(payload).get('id') == ack_id:
+                        return
+            except (OSError, ValueError):
+                self._close_socket()
+                raise
+            finally:
+                if self._sock:
+                    self._sock.settimeout(self.timeout)
+
+    def close(self):
+        """
+        Closes the connection once the server has echoed the close frame back, which it does only after handling every message
+        sent before it
+        """
+        with self._lock:
+            if self._sock:
+                try:
+                    self._sock.sendall(encode_websocket_frame(b'', opcode=0x8, mask=True))
+                    while self._receive_message()[0] != 0x8:
+                        pass
+                except (OSError, ValueError):
+                    pass  # already gone, or too slow to answer
+            self._close_socket()